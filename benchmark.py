@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import pandas as pd
+
+from export import export_action
+from import_ import import_action
+from synthetic_data import generate_export_files, generate_pcs_file
+
+
+BENCHMARK_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+
+def current_commit():
+    """The short hash of the checked out commit and whether the tree has changes."""
+    folder = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=folder,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=folder,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def benchmark_data(data_folder, rows, stores, days, encoding, dok_datum=True):
+    """
+    The generated inputs for one size, kept in data_folder so the large sizes
+    are only generated once. Returns the export file paths and the PCS file.
+    """
+    folder = os.path.join(data_folder, f"{rows}_{stores}_{days}_{encoding}")
+    if not dok_datum:
+        folder += "_no_dok_datum"
+    done = os.path.join(folder, "complete")
+    if not os.path.exists(done):
+        print(f"Generating {rows} rows in {folder}")
+        generate_export_files(
+            os.path.join(folder, "export"),
+            rows,
+            stores,
+            days,
+            encoding=encoding,
+            dok_datum=dok_datum,
+        )
+        generate_pcs_file(os.path.join(folder, "PCS.ADM"), rows)
+        open(done, "w").close()
+
+    export_folder = os.path.join(folder, "export")
+    file_paths = sorted(
+        os.path.join(export_folder, file_name) for file_name in os.listdir(export_folder)
+    )
+    return file_paths, os.path.join(folder, "PCS.ADM")
+
+
+def time_quietly(action, *args, **kwargs):
+    """Seconds spent in action, with what it prints thrown away."""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        action(*args, **kwargs)
+        return time.perf_counter() - start
+
+
+def run_benchmarks(
+    sizes=BENCHMARK_SIZES,
+    stores=8,
+    days=1,
+    encoding="ISO-8859-1",
+    results_file="benchmarks.jsonl",
+    data_folder=None,
+    export_options=None,
+    repeat=3,
+    actions=("export", "import"),
+    dok_datum=True,
+):
+    """
+    Times export_action and import_action on generated inputs of each size in
+    sizes, the Försäljning rows of the export and the article records of the
+    PCS.ADM file.
+
+    The fastest of repeat runs is appended to results_file as one JSON line
+    per action and size, with the commit it was measured on. export_options
+    are passed on to export_action. With dok_datum False only Försäljning
+    and Följesedlar have a Dok.datum column.
+    """
+    data_folder = data_folder or os.path.join(tempfile.gettempdir(), "winbag_benchmark")
+    export_options = export_options or {}
+    commit, dirty = current_commit()
+    results = []
+
+    for rows in sizes:
+        file_paths, pcs_path = benchmark_data(
+            data_folder, rows, stores, days, encoding, dok_datum
+        )
+
+        with tempfile.TemporaryDirectory() as output_folder:
+            runs = {}
+            if "export" in actions:
+                runs["export"] = lambda: time_quietly(
+                    export_action,
+                    file_paths,
+                    export_folder=output_folder,
+                    **export_options,
+                )
+            if "import" in actions:
+                runs["import"] = lambda: time_quietly(
+                    import_action, [pcs_path], import_folder=output_folder
+                )
+
+            for action, run in runs.items():
+                seconds = min(run() for _ in range(repeat))
+                result = {
+                    "action": action,
+                    "rows": rows,
+                    "stores": stores,
+                    "days": days,
+                    "dok_datum": dok_datum,
+                    "encoding": encoding,
+                    "seconds": round(seconds, 4),
+                    "rows_per_second": round(rows / seconds),
+                    "options": {name: repr(value) for name, value in export_options.items()}
+                    if action == "export"
+                    else {},
+                    "commit": commit,
+                    "dirty": dirty,
+                    "measured": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "pandas": pd.__version__,
+                }
+                print(f"{action} {rows} rows: {seconds:.3f}s")
+                results.append(result)
+                with open(results_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result) + "\n")
+
+    return results
+
+
+def compare_benchmarks(results_file, base_commit, commit=None):
+    """
+    Compares the results measured on commit, by default the last one in
+    results_file, with those of base_commit.
+
+    Returns (action, rows, base seconds, seconds, speedup) for every action and
+    size both have, the latest result of each being used.
+    """
+    latest = {}
+    last_commit = None
+    with open(results_file, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                latest[(result["commit"], result["action"], result["rows"])] = result
+                last_commit = result["commit"]
+
+    if commit is None:
+        commit = last_commit
+
+    comparison = []
+    for (result_commit, action, rows), result in latest.items():
+        if result_commit != commit:
+            continue
+        base = latest.get((base_commit, action, rows))
+        if base is None:
+            continue
+        comparison.append(
+            (
+                action,
+                rows,
+                base["seconds"],
+                result["seconds"],
+                base["seconds"] / result["seconds"],
+            )
+        )
+    return sorted(comparison)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Times export_action and import_action on generated inputs."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=BENCHMARK_SIZES)
+    parser.add_argument("--stores", type=int, default=8)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--encoding", default="ISO-8859-1")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--results", default="benchmarks.jsonl")
+    parser.add_argument("--data-folder")
+    parser.add_argument("--actions", nargs="+", default=["export", "import"])
+    parser.add_argument("--no-dok-datum", action="store_true")
+    parser.add_argument(
+        "--options",
+        default="{}",
+        help='export_action options as JSON, e.g. \'{"chunksize": 100000}\'',
+    )
+    parser.add_argument(
+        "--compare", metavar="BASE_COMMIT", help="only compare the last results with BASE_COMMIT"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        for action, rows, base_seconds, seconds, speedup in compare_benchmarks(
+            args.results, args.compare
+        ):
+            print(f"{action} {rows} rows: {base_seconds:.3f}s -> {seconds:.3f}s ({speedup:.2f}x)")
+        sys.exit(0)
+
+    run_benchmarks(
+        sizes=args.sizes,
+        stores=args.stores,
+        days=args.days,
+        encoding=args.encoding,
+        results_file=args.results,
+        data_folder=args.data_folder,
+        export_options=json.loads(args.options),
+        repeat=args.repeat,
+        actions=args.actions,
+        dok_datum=not args.no_dok_datum,
+    )
@@ -0,0 +1,328 @@
+import argparse
+import ast
+import os
+import re
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import export
+from export_loader import match_export_inputs
+from receipt_checkpoint import ReceiptCheckpoint
+from synthetic_data import generate_export_files
+
+
+# How the inputs were read before export_loader, the row by row builders were
+# written against these frames
+REFERENCE_DTYPES = {
+    "forsäljning": {"Referens": str, "Netto": str, "Varugrupp": str, "ButikskodWinbag": str},
+    "betalsätt": {"Belopp": str, "ButikskodWinbag": str},
+    "följesedlar": {"Netto": str, "Referens": str, "ButikskodWinbag": str},
+    "moms": {"Totalbelopp": str, "Basbelopp": str, "ButikskodMomsWinbag": str},
+    "presentkort": {"Belopp": str, "ButikskodWinbag": str},
+    "presentkort_sålda": {"Belopp": str, "Kort": str, "ButikskodWinbag": str},
+}
+
+# The amount columns of each input file that the fuzzing rewrites
+AMOUNT_COLUMNS = {
+    "Försäljning": ["Netto", "Pris "],
+    "Betalsätt": ["Belopp"],
+    "Följesedlar": ["Netto", "Pris "],
+    "Moms": ["Basbelopp", "Moms_2", "Totalbelopp"],
+    "Presentkort_used": ["Belopp"],
+    "Presentkort_sold": ["Belopp"],
+}
+
+
+class Difference(NamedTuple):
+    """
+    A record type whose lines differ in one store file. record_type is None
+    for a file only one of the exports wrote, and "order" when every record
+    type has the same lines but they are written in another order.
+    """
+
+    file_name: str
+    record_type: object
+    expected: list
+    actual: list
+
+
+def export_reference(file_paths, export_folder):
+    """
+    Exports file_paths with the row by row data_XX builders, read and written
+    the way export_action did before the columnar engine, as the output the
+    other export paths have to match byte for byte.
+    """
+    frames = {name: None for name in REFERENCE_DTYPES}
+    for name, (file_path, _) in match_export_inputs(file_paths).items():
+        frames[name] = pd.read_csv(
+            file_path, sep=";", dtype=REFERENCE_DTYPES[name], encoding="ISO-8859-1"
+        )
+
+    if frames["forsäljning"] is None or frames["betalsätt"] is None or frames["moms"] is None:
+        raise ValueError("One or more required files are missing from the file paths.")
+
+    forsäljning_data = frames["forsäljning"]
+    file_map = export.create_resulting_files(forsäljning_data, export_folder)
+    for target_file in file_map.values():
+        open(target_file, "w").close()
+
+    export.data_00(file_map)
+    export.data_01_02(frames["följesedlar"], file_map)
+    export.data_03(forsäljning_data, file_map)
+    export.data_04(frames["betalsätt"], file_map, frames["presentkort_sålda"])
+    export.data_04_följesedlar(frames["följesedlar"], file_map)
+    export.data_04_presentkort(frames["presentkort"], file_map)
+    export.data_05(forsäljning_data, file_map)
+    export.data_06(forsäljning_data, file_map)
+    export.data_07(forsäljning_data, file_map)
+    export.data_08(forsäljning_data, file_map)
+    export.data_09(forsäljning_data, file_map)
+    export.data_10(forsäljning_data, file_map)
+    export.data_11(forsäljning_data, file_map)
+    export.data_12(frames["moms"], file_map)
+    export.data_99(file_map)
+    return file_map
+
+
+def read_export_files(export_folder):
+    """
+    {file name: bytes} of the store files in export_folder, the HHMM the file
+    names end with left out so two exports of the same inputs line up.
+    """
+    files = {}
+    for file_name in os.listdir(export_folder):
+        if file_name.endswith(".TXT"):
+            with open(os.path.join(export_folder, file_name), "rb") as f:
+                files[re.sub(r"_\d{4}\.TXT$", ".TXT", file_name)] = f.read()
+    return files
+
+
+def lines_per_record_type(content):
+    records = {}
+    for line in content.splitlines(keepends=True):
+        records.setdefault(line[1:3].decode("ISO-8859-1"), []).append(line)
+    return records
+
+
+def diff_exports(expected_files, actual_files):
+    """The Differences between two {file name: bytes} of read_export_files."""
+    differences = []
+    for file_name in sorted(expected_files.keys() | actual_files.keys()):
+        expected = expected_files.get(file_name)
+        actual = actual_files.get(file_name)
+        if expected == actual:
+            continue
+        if expected is None or actual is None:
+            differences.append(
+                Difference(
+                    file_name,
+                    None,
+                    [] if expected is None else [expected],
+                    [] if actual is None else [actual],
+                )
+            )
+            continue
+
+        expected_records = lines_per_record_type(expected)
+        actual_records = lines_per_record_type(actual)
+        record_types = sorted(expected_records.keys() | actual_records.keys())
+        for record_type in record_types:
+            expected_lines = expected_records.get(record_type, [])
+            actual_lines = actual_records.get(record_type, [])
+            if expected_lines != actual_lines:
+                differences.append(
+                    Difference(file_name, record_type, expected_lines, actual_lines)
+                )
+
+        if all(expected_records.get(t) == actual_records.get(t) for t in record_types):
+            differences.append(
+                Difference(file_name, "order", expected.splitlines(True), actual.splitlines(True))
+            )
+    return differences
+
+
+def run_quietly(action, *args, **kwargs):
+    """
+    Runs action with what it prints thrown away. Returns the name of the
+    exception it raised, or None, since an input the reference can't export
+    must fail in the other paths too.
+    """
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        try:
+            action(*args, **kwargs)
+        except Exception as e:
+            return type(e).__name__
+    return None
+
+
+def compare_exports(file_paths, options=None):
+    """
+    Exports file_paths with export_reference and with export_action and
+    options, e.g. {"workers": 4}, and returns the Differences between them.
+    {"checkpoint": True} exports through a new ReceiptCheckpoint.
+
+    When only one of them raises the result is a single Difference with the
+    exception name. The engine builds the records in another order than the
+    reference, so an input both fail on may fail with another exception.
+    """
+    options = dict(options or {})
+    with tempfile.TemporaryDirectory() as expected_folder, tempfile.TemporaryDirectory() as (
+        actual_folder
+    ), tempfile.TemporaryDirectory() as checkpoint_folder:
+        if options.get("checkpoint") is True:
+            options["checkpoint"] = ReceiptCheckpoint(
+                os.path.join(checkpoint_folder, "checkpoint.sqlite")
+            )
+        expected_error = run_quietly(export_reference, file_paths, expected_folder)
+        actual_error = run_quietly(
+            export.export_action, file_paths, export_folder=actual_folder, **options
+        )
+        if options.get("checkpoint") is not None:
+            options["checkpoint"].connection.close()
+        if expected_error or actual_error:
+            if expected_error and actual_error:
+                return []
+            return [Difference("", "error", [expected_error], [actual_error])]
+
+        return diff_exports(read_export_files(expected_folder), read_export_files(actual_folder))
+
+
+def random_amount(rng, blanks=True):
+    """An amount in one of the forms seen in, or close to, WinBag files."""
+    kronor = int(rng.choice([0, 1, 12, 149, 1490, 12345, 1234567]))
+    öre = int(rng.integers(0, 100))
+    sign = "-" if rng.random() < 0.2 else ""
+    grouped = f"{kronor:,}".replace(",", ".")
+    forms = [
+        f"{sign}{grouped}",  # '1.490'
+        f"{sign}{kronor}",  # '1490'
+        f"{sign}{kronor},{öre:02d}",  # '1,49'
+        f"{sign}{grouped},{öre:02d}",  # '1.490,49'
+        f"{sign}{kronor},{öre % 10}",  # '149,5'
+        f"{sign}{kronor}.{öre:02d}",  # '1.49'
+        f"{sign}{kronor}.{öre % 10}",  # '149.5'
+        f"{sign}{kronor},{öre:02d}{öre % 10}",  # '1,495'
+        f" {sign}{kronor},{öre:02d} ",  # ' 1,49 '
+        "0",
+        "-0,00",
+    ]
+    if blanks:
+        forms.append("")
+    return forms[int(rng.integers(0, len(forms)))]
+
+
+def fuzz_amounts(file_paths, rng, share, blanks=True):
+    """Rewrites a share of the amounts in file_paths with random_amount."""
+    for file_path in file_paths:
+        file_name = os.path.basename(file_path)
+        columns = next(
+            (columns for marker, columns in AMOUNT_COLUMNS.items() if marker in file_name), []
+        )
+        data = pd.read_csv(
+            file_path, sep=";", dtype=str, keep_default_na=False, encoding="ISO-8859-1"
+        )
+        for column in columns:
+            fuzzed = rng.random(len(data)) < share
+            data.loc[fuzzed, column] = [
+                random_amount(rng, blanks) for _ in range(fuzzed.sum())
+            ]
+        data.to_csv(file_path, sep=";", index=False, encoding="ISO-8859-1")
+
+
+def fuzz_exports(
+    runs=50, rows=300, stores=3, seed=0, options=None, keep_folder=None, dok_datum=True
+):
+    """
+    Compares the exports of runs generated inputs with their amounts rewritten
+    by random_amount, some runs with a few odd amounts and some with many, so
+    both the columnar builders and their Decimal fallbacks are checked. Blank
+    amounts make most exports fail, so only every other run has them. With
+    dok_datum False only Försäljning and Följesedlar have a Dok.datum column.
+
+    Returns {seed of the run: Differences} for the runs that differ. The
+    inputs of those runs are copied to keep_folder when it is given.
+    """
+    failures = {}
+    for run in range(runs):
+        run_seed = seed + run
+        rng = np.random.default_rng(run_seed)
+        with tempfile.TemporaryDirectory() as folder:
+            file_paths = generate_export_files(
+                folder, rows, stores, seed=run_seed, dok_datum=dok_datum
+            )
+            fuzz_amounts(
+                file_paths,
+                rng,
+                share=float(rng.choice([0.0, 0.01, 0.1, 0.5])),
+                blanks=run % 2 == 1,
+            )
+
+            differences = compare_exports(file_paths, options)
+            if differences:
+                failures[run_seed] = differences
+                if keep_folder is not None:
+                    shutil.copytree(folder, os.path.join(keep_folder, str(run_seed)))
+    return failures
+
+
+def print_differences(differences, limit=5):
+    for difference in differences[:limit]:
+        print(f"{difference.file_name} record {difference.record_type}:")
+        print(f"  expected: {difference.expected[:3]}")
+        print(f"  actual:   {difference.actual[:3]}")
+    if len(differences) > limit:
+        print(f"  ... and {len(differences) - limit} more")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Checks that export_action writes the same files as the row by row builders."
+    )
+    parser.add_argument("folders", nargs="*", help="folders with recorded input files")
+    parser.add_argument("--options", default="{}", help="export_action options as a Python dict")
+    parser.add_argument("--fuzz", type=int, default=0, metavar="RUNS")
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-folder")
+    parser.add_argument(
+        "--no-dok-datum",
+        action="store_true",
+        help="leave Dok.datum out of the files the README lists without it",
+    )
+    args = parser.parse_args()
+    options = ast.literal_eval(args.options)
+
+    failed = False
+    for folder in args.folders:
+        file_paths = [
+            os.path.join(folder, file_name)
+            for file_name in sorted(os.listdir(folder))
+            if file_name.endswith(".csv")
+        ]
+        differences = compare_exports(file_paths, options)
+        print(f"{folder}: {'OK' if not differences else f'{len(differences)} differences'}")
+        print_differences(differences)
+        failed = failed or bool(differences)
+
+    if args.fuzz:
+        failures = fuzz_exports(
+            args.fuzz,
+            args.rows,
+            seed=args.seed,
+            options=options,
+            keep_folder=args.keep_folder,
+            dok_datum=not args.no_dok_datum,
+        )
+        print(f"Fuzzed {args.fuzz} exports, {len(failures)} differ")
+        for run_seed, differences in failures.items():
+            print(f"Seed {run_seed}:")
+            print_differences(differences)
+        failed = failed or bool(failures)
+
+    sys.exit(1 if failed else 0)
@@ -3,123 +3,567 @@ import pandas as pd
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import pytz
-import time
 import math
+import tempfile
 from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor
+
+from formatting import (
+    format_datum,
+    format_time,
+    format_time_interval,
+    format_value_as_integer_string,
+    format_antal_as_integer_string,
+    format_rabatt_nr,
+    format_sales_date,
+    smart_parse_amount,
+)
+from output_sink import OutputSink, encode_rows
+from metrics import record_run, stage, count_input, count_output, is_recording, row_count
+from export_loader import load_export_inputs
+from export_engine import (
+    build_partition_index,
+    build_sales_records,
+    SalesRecordAccumulator,
+    build_payment_records,
+    build_följesedlar_records,
+    build_följesedlar_payment_records,
+    build_presentkort_records,
+    build_moms_records,
+    find_last_sales_row,
+    warn_unmatched,
+    sum_presentkort_sålda,
+)
+from receipt_checkpoint import receipt_keys
+
+
+def export_action(
+    file_paths,
+    workers=None,
+    chunksize=None,
+    split_days=False,
+    input_cache=None,
+    csv_engine="c",
+    metrics_file=None,
+    trace_memory=False,
+    checkpoint=None,
+    export_folder="C:/winbag_export",
+):
+    """
+    Exports the WinBag files in file_paths to one HiOPOS file per store.
 
+    With workers > 1 the records of each store are built in a pool of that many
+    processes. With a chunksize the Försäljning file is streamed that many rows
+    at a time instead of being loaded as a whole. The output is the same as for
+    the serial export.
 
-def export_action(file_paths):
-    # Match file names to specific data objects
-    forsäljning_data = None
-    betalsätt_data = None
-    följesedlar_data = None
-    presentkort_data = None
-    presentkort_sålda_data = None
-    time.sleep(1)
-
-    for file_path in file_paths:
-        file_name = os.path.basename(file_path)
-
-        if "Försäljning" in file_name:
-            forsäljning_data = pd.read_csv(
-                file_path,
-                sep=";",
-                dtype={"Referens": str, "Netto": str, "Varugrupp": str, "ButikskodWinbag": str},
-                encoding="ISO-8859-1",
-            )
+    With split_days the inputs are split by Dok.datum and one file per store
+    and day is written, each stamped with its own date.
+
+    input_cache is an InputCache that keeps the parsed input files, so a rerun
+    on the same files skips the CSV parsing. csv_engine="pyarrow" parses the
+    files with pyarrow when it is installed.
+
+    With a metrics_file the time, rows, records and bytes of each stage of the
+    export are appended to it as one JSON line, with trace_memory also their
+    peak memory, see record_run.
+
+    With a checkpoint, a ReceiptCheckpoint, the files are taken to be a
+    snapshot of the day so far and only the receipts not exported from an
+    earlier snapshot are processed, see export_incremental.
 
-        elif "Betalsätt" in file_name:
-            betalsätt_data = pd.read_csv(
-                file_path,
-                sep=";",
-                encoding="ISO-8859-1",
-                dtype={"Belopp": str, "ButikskodWinbag": str}  # 👈 this preserves "1.490" as string
+    The store files are written to export_folder.
+    """
+    with record_run("export", metrics_file, file_paths, trace_memory):
+        if workers and workers > 1 and chunksize:
+            raise ValueError("A chunked export can't be combined with workers.")
+        if split_days and chunksize:
+            raise ValueError("A chunked export can't be split by day.")
+        if checkpoint is not None and (chunksize or split_days or (workers and workers > 1)):
+            raise ValueError(
+                "An incremental export can't be combined with chunksize, split_days or workers."
             )
 
-        elif "Följesedlar" in file_name:
-            följesedlar_data = pd.read_csv(
-                file_path,
-                sep=";",
-                dtype={"Netto": str, "Referens": str, "ButikskodWinbag": str},
-                encoding="ISO-8859-1",
+        # All input files are parsed at the same time
+        with stage("load"):
+            loaded = load_export_inputs(
+                file_paths, chunksize=chunksize, cache=input_cache, engine=csv_engine
             )
+            count_input(sum(row_count(data) for data in loaded[:-1]))
+        forsäljning_data = loaded.forsäljning
+        betalsätt_data = loaded.betalsätt
+        följesedlar_data = loaded.följesedlar
+        presentkort_data = loaded.presentkort
+        moms_data = loaded.moms
+        presentkort_sålda_data = loaded.presentkort_sålda
+
+        for name, seconds in loaded.timings.items():
+            print(f"Loaded {name} in {seconds:.2f}s")
+
+        if forsäljning_data is None or betalsätt_data is None or moms_data is None:
+            raise ValueError("One or more required files are missing from the file paths.")
+
+        # Only raise a warning if `presentkort_sålda_data` is missing
+        if presentkort_sålda_data is None:
+            print("Warning: 'Presentkort_sold.csv' is missing. Proceeding without it.")
+
+        if presentkort_data is None:
+            print("Warning: 'Presentkort_used.csv' is missing. Proceeding without it.")
+
+        if följesedlar_data is None:
+            print("Warning: 'Följesedlar.csv' is missing. Proceeding without it.")
+
+        inputs = [
+            forsäljning_data,
+            betalsätt_data,
+            följesedlar_data,
+            presentkort_data,
+            moms_data,
+            presentkort_sålda_data,
+        ]
 
+        if chunksize:
+            # Försäljning is a reader of chunks here, each chunk is folded into the
+            # records and dropped before the next one is read. The 06 lines go to
+            # a file per store and are copied into the store files when flushed
+            with tempfile.TemporaryDirectory() as spill_folder:
+                with forsäljning_data as chunks, stage("sales_chunks"):
+                    accumulator, butikskoder, sales_date = accumulate_sales_chunks(
+                        chunks, spill_folder
+                    )
+                file_map = create_file_map(butikskoder, sales_date, export_folder)
+                inputs[0] = None
+                export_files(
+                    export_folder,
+                    inputs,
+                    file_map=file_map,
+                    sales_records=accumulator.records(file_map),
+                )
+        elif split_days:
+            for sales_date, day_inputs in split_inputs_by_day(inputs).items():
+                print(f"Exporting sales date {sales_date}")
+                export_files(export_folder, day_inputs, workers)
+        elif checkpoint is not None:
+            export_incremental(export_folder, inputs, checkpoint)
+        else:
+            export_files(export_folder, inputs, workers)
 
-        elif "Moms" in file_name:
-            moms_data = pd.read_csv(
-                file_path, sep=";", dtype={
-                "Totalbelopp": str,
-                "Basbelopp": str,
-                "ButikskodMomsWinbag": str
-            }, encoding="ISO-8859-1"
-            )
+        print(f"All files saved to folder: {export_folder}")
 
+    # Add further export functionality here
 
-        elif "Presentkort_used" in file_name:
-            presentkort_data = pd.read_csv(
-                file_path, sep=";", dtype={"Belopp": str, "ButikskodWinbag": str}, encoding="ISO-8859-1"
-            )
 
-        elif "Presentkort_sold" in file_name:
-            presentkort_sålda_data = pd.read_csv(
-                file_path,
-                sep=";",
-                dtype={"Belopp": str, "Kort": str, "ButikskodWinbag": str},
-                encoding="ISO-8859-1",
-            )
+def export_files(
+    export_folder,
+    inputs,
+    workers=None,
+    file_map=None,
+    sales_records=None,
+    payment_records=None,
+):
+    """
+    Writes one HiOPOS file per store in export_folder. inputs are the input
+    frames in the order export_records takes them.
+    """
+    följesedlar_data = inputs[2]
 
-    if forsäljning_data is None or betalsätt_data is None or moms_data is None:
-        raise ValueError("One or more required files are missing from the file paths.")
+    if file_map is None:
+        file_map = create_resulting_files(inputs[0], export_folder)
 
-    # Only raise a warning if `presentkort_sålda_data` is missing
-    if presentkort_sålda_data is None:
-        print("Warning: 'Presentkort_sold.csv' is missing. Proceeding without it.")
+    # Every record is collected per store file and written once at the end
+    sink = OutputSink(file_map)
 
-    if presentkort_data is None:
-        print("Warning: 'Presentkort_used.csv' is missing. Proceeding without it.")
+    with stage("data_00"):
+        data_00(file_map, sink)
+    with stage("data_01_02", row_count(följesedlar_data)):
+        write_records(build_följesedlar_records(följesedlar_data, file_map), sink)
 
-    if följesedlar_data is None:
-        print("Warning: 'Följesedlar.csv' is missing. Proceeding without it.")
+    if workers and workers > 1:
+        with stage("data_03_12", sum(row_count(data) for data in inputs)):
+            export_stores_in_parallel(file_map, sink, workers, *inputs)
+    else:
+        export_records(
+            file_map,
+            sink,
+            *inputs,
+            sales_records=sales_records,
+            payment_records=payment_records,
+        )
 
-    file_path = file_paths[0]
-    # base_dir = os.path.dirname(file_path)
-    export_folder = os.path.join("C:/winbag_export")
+    with stage("data_99"):
+        data_99(file_map, sink)
+    with stage("flush"):
+        sink.flush()
 
+    return file_map
+
+def export_incremental(export_folder, inputs, checkpoint):
+    """
+    Exports inputs, a snapshot of the files of one day, turning only the
+    Försäljning and Betalsätt receipts that checkpoint hasn't seen yet into
+    records. Their 04, 06, 08 and 10 records are added to what checkpoint kept
+    from the earlier snapshots, so the files written are the same as those of
+    a full export of the snapshot.
+
+    A receipt, its (ButikskodWinbag, Serie, Nummer, Dok.datum), is taken to be
+    complete the first time it is seen, rows added to it in a later snapshot
+    are not exported. Följesedlar, Presentkort, Moms and the 03, 05, 07, 09
+    and 11 records are small and built from the whole snapshot every time.
+    """
+    forsäljning_data, betalsätt_data = inputs[0], inputs[1]
+    presentkort_sålda_data = inputs[5]
+
+    for name, data in [("Försäljning", forsäljning_data), ("Betalsätt", betalsätt_data)]:
+        if "Serie" not in data.columns or "Nummer" not in data.columns:
+            raise ValueError(f"An incremental export needs the Serie and Nummer of {name}.")
+        if data["Nummer"].isna().any():
+            print(
+                f"Warning: {name} has rows without Nummer, they can't be told apart "
+                "from those of an earlier snapshot."
+            )
 
     file_map = create_resulting_files(forsäljning_data, export_folder)
+    export_date = str(forsäljning_data.iloc[0]["Dok.datum"])
 
+    # Two snapshots of a day would both add their receipts to the same state,
+    # so they are exported one at a time
+    with checkpoint.day_lock(export_date):
+        return export_new_receipts(export_folder, inputs, checkpoint, file_map, export_date)
 
-    data_00(file_map)
-    data_01_02(följesedlar_data, file_map)
-    data_03(forsäljning_data, file_map)
-    data_04(betalsätt_data, file_map, presentkort_sålda_data)
-    data_04_följesedlar(följesedlar_data, file_map)
-    data_04_presentkort(presentkort_data, file_map)
-    data_05(forsäljning_data, file_map)
-    data_06(forsäljning_data, file_map)
-    data_07(forsäljning_data, file_map)
-    data_08(forsäljning_data, file_map)
-    data_09(forsäljning_data, file_map)
-    data_10(forsäljning_data, file_map)
-    data_11(forsäljning_data, file_map)
-    data_12(moms_data, file_map)
+def export_new_receipts(export_folder, inputs, checkpoint, file_map, export_date):
+    """
+    The part of export_incremental that reads and updates the checkpoint of
+    export_date, run while holding its day_lock.
+    """
+    forsäljning_data, betalsätt_data = inputs[0], inputs[1]
+    presentkort_sålda_data = inputs[5]
+
+    sålda_per_betalmedel = None
+    if presentkort_sålda_data is not None:
+        sålda_per_betalmedel = sum_presentkort_sålda(presentkort_sålda_data)
+
+    state = checkpoint.load(export_date)
+    if state is None or (presentkort_sålda_data is not None and sålda_per_betalmedel is None):
+        # The amounts of this day need the Decimal parsing of data_04
+        print(f"Exporting all receipts of {export_date}")
+        return export_files(export_folder, inputs, file_map=file_map)
+    sales, payments = state
+
+    with stage("new_receipts", len(forsäljning_data) + len(betalsätt_data)):
+        sales_keys = receipt_keys(forsäljning_data, export_date)
+        payment_keys = receipt_keys(betalsätt_data, export_date)
+        new_sales = checkpoint.new_rows(export_date, "försäljning", sales_keys)
+        new_payments = checkpoint.new_rows(export_date, "betalsätt", payment_keys)
+        new_forsäljning_data = forsäljning_data[new_sales]
+        new_betalsätt_data = betalsätt_data[new_payments]
+        print(
+            f"Exporting {len(new_forsäljning_data)} new Försäljning and "
+            f"{len(new_betalsätt_data)} new Betalsätt rows of {export_date}"
+        )
 
-    data_99(file_map)
+    with stage("sales_records", len(new_forsäljning_data)):
+        lines_06_before = {butikskod: len(lines) for butikskod, lines in sales.lines_06.items()}
+        sales.add(
+            new_forsäljning_data,
+            build_partition_index(new_forsäljning_data["ButikskodWinbag"], file_map),
+        )
+        last_sales_row = find_last_sales_row(
+            forsäljning_data,
+            build_partition_index(forsäljning_data["ButikskodWinbag"], file_map),
+        )
 
-    print(f"All files saved to folder: {export_folder}")
+    with stage("payment_records", len(new_betalsätt_data)):
+        payment_index = build_partition_index(new_betalsätt_data["ButikskodWinbag"], file_map)
+        warn_unmatched(new_betalsätt_data["ButikskodWinbag"], payment_index)
+        if not payments.add(new_betalsätt_data, payment_index):
+            print(f"Exporting all receipts of {export_date} from now on")
+            checkpoint.mark_full(export_date)
+            return export_files(export_folder, inputs, file_map=file_map)
+
+    missing = [
+        butikskod
+        for butikskod in list(sales.headers) + list(payments.sums)
+        if butikskod not in file_map
+    ]
+    if missing:
+        raise ValueError(
+            f"Butikskod {', '.join(dict.fromkeys(missing))} of an earlier snapshot "
+            f"is missing from the Försäljning of {export_date}."
+        )
 
-    # Add further export functionality here
+    export_files(
+        export_folder,
+        inputs,
+        file_map=file_map,
+        sales_records=sales.records(file_map, last_sales_row),
+        payment_records=payments.records(file_map, sålda_per_betalmedel),
+    )
 
+    with stage("checkpoint"):
+        checkpoint.save(
+            export_date,
+            {
+                "försäljning": pd.unique(sales_keys[new_sales]),
+                "betalsätt": pd.unique(payment_keys[new_payments]),
+            },
+            sales,
+            {
+                butikskod: lines[lines_06_before.get(butikskod, 0):]
+                for butikskod, lines in sales.lines_06.items()
+            },
+            payments,
+        )
+    return file_map
 
-def create_resulting_files(forsäljning_data, target_folder):
-    file_map = {}
+def split_inputs_by_day(inputs):
+    """
+    Splits the input frames by Dok.datum, returning {Dok.datum: inputs} in the
+    order the dates first appear in Försäljning.
 
-    if not os.path.exists(target_folder):
-        os.makedirs(target_folder)
+    An input without a Dok.datum column can't be split, so a multi-day export
+    with one raises ValueError instead of putting the whole file in every day.
+    The README lists Dok.datum for every file for this reason, a single day
+    export only needs it in Försäljning and Följesedlar.
+    """
+    forsäljning_data = inputs[0]
+    days = dict.fromkeys(forsäljning_data["Dok.datum"].dropna().unique())
+
+    if len(days) <= 1:
+        return {sales_date: inputs for sales_date in days}
+
+    file_names = [
+        "Försäljning",
+        "Betalsätt",
+        "Följesedlar",
+        "Presentkort_used",
+        "Moms",
+        "Presentkort_sold",
+    ]
+    per_day_inputs = {sales_date: [] for sales_date in days}
+    for file_name, data in zip(file_names, inputs):
+        if data is None:
+            for day_inputs in per_day_inputs.values():
+                day_inputs.append(None)
+            continue
 
+        if "Dok.datum" not in data.columns:
+            raise ValueError(
+                f"{file_name} has no Dok.datum column, it is needed to split the export by day."
+            )
+
+        day_index = build_partition_index(data["Dok.datum"], days)
+        for sales_date, day_inputs in per_day_inputs.items():
+            day_inputs.append(data.take(day_index.get(sales_date, [])))
+
+    return per_day_inputs
+
+def export_records(
+    file_map,
+    sink,
+    forsäljning_data,
+    betalsätt_data,
+    följesedlar_data,
+    presentkort_data,
+    moms_data,
+    presentkort_sålda_data,
+    last_sales_row=None,
+    sales_records=None,
+    payment_records=None,
+):
+    """
+    Builds the 03 to 12 records of every file in file_map into sink.
+
+    last_sales_row overrides the last matching Försäljning row used by the 08
+    and 11 records, for when forsäljning_data is only part of the export.
+    sales_records are the Försäljning based records when they have already been
+    built, e.g. by a chunked export, and forsäljning_data is not used then.
+    payment_records are the Betalsätt 04 records when they have already been
+    built, e.g. by an incremental export.
+    """
+    # Row positions per store, built once per input file and shared by the builders
+    with stage("partition_index"):
+        betalsätt_index = build_partition_index(betalsätt_data["ButikskodWinbag"], file_map)
+        moms_index = build_partition_index(moms_data["ButikskodMomsWinbag"], file_map)
+        följesedlar_index = None
+        if följesedlar_data is not None:
+            följesedlar_index = build_partition_index(följesedlar_data["ButikskodWinbag"], file_map)
+        presentkort_index = None
+        if presentkort_data is not None:
+            presentkort_index = build_partition_index(presentkort_data["ButikskodWinbag"], file_map)
+
+    # All Försäljning based records (03, 05-11) are built in a single pass
+    if sales_records is None:
+        with stage("sales_records", len(forsäljning_data)):
+            sales_index = build_partition_index(forsäljning_data["ButikskodWinbag"], file_map)
+            sales_records = build_sales_records(
+                forsäljning_data, file_map, sales_index, last_sales_row
+            )
+
+    with stage("data_03"):
+        write_records(sales_records["03"], sink)
+
+    # The columnar builders return None when an amount needs the exact
+    # Decimal handling of the original data_XX builder
+    with stage("data_04", len(betalsätt_data)):
+        if payment_records is None:
+            payment_records = build_payment_records(
+                betalsätt_data, file_map, betalsätt_index, presentkort_sålda_data
+            )
+        if payment_records is None:
+            data_04(betalsätt_data, file_map, presentkort_sålda_data, sink)
+        else:
+            write_records(payment_records, sink)
+
+    with stage("data_04_följesedlar", row_count(följesedlar_data)):
+        följesedlar_records = build_följesedlar_payment_records(
+            följesedlar_data, file_map, följesedlar_index
+        )
+        if följesedlar_records is None:
+            data_04_följesedlar(följesedlar_data, file_map, sink)
+        else:
+            write_records(följesedlar_records, sink)
+
+    with stage("data_04_presentkort", row_count(presentkort_data)):
+        presentkort_records = build_presentkort_records(
+            presentkort_data, file_map, presentkort_index
+        )
+        if presentkort_records is None:
+            data_04_presentkort(presentkort_data, file_map, sink)
+        else:
+            write_records(presentkort_records, sink)
+
+    with stage("data_05_11"):
+        write_records(sales_records["05"], sink)
+        for target_file, lines in sales_records["06"].items():
+            sink.write_lines(target_file, lines)
+        for record_type in ["07", "08", "09", "10", "11"]:
+            write_records(sales_records[record_type], sink)
+
+    with stage("data_12", len(moms_data)):
+        moms_records = build_moms_records(moms_data, file_map, moms_index)
+        if moms_records is None:
+            data_12(moms_data, file_map, sink)
+        else:
+            write_records(moms_records, sink)
+
+def export_stores_in_parallel(
+    file_map,
+    sink,
+    workers,
+    forsäljning_data,
+    betalsätt_data,
+    följesedlar_data,
+    presentkort_data,
+    moms_data,
+    presentkort_sålda_data,
+):
+    """
+    Splits the inputs by store and runs export_records for each store in a
+    process pool. The stores never share a file, so only the values that
+    data_04, data_08 and data_11 take from the whole input are passed along:
+    Presentkort_sold as a whole and the last matching Försäljning row.
+    """
+    per_store_inputs = [
+        (forsäljning_data, "ButikskodWinbag"),
+        (betalsätt_data, "ButikskodWinbag"),
+        (följesedlar_data, "ButikskodWinbag"),
+        (presentkort_data, "ButikskodWinbag"),
+        (moms_data, "ButikskodMomsWinbag"),
+    ]
+    indexes = []
+    for data, column in per_store_inputs:
+        if data is None:
+            indexes.append(None)
+            continue
+        index = build_partition_index(data[column], file_map)
+        warn_unmatched(data[column], index)
+        indexes.append(index)
+
+    sales_index = indexes[0]
+    last_sales_row = find_last_sales_row(forsäljning_data, sales_index)
+
+    jobs = []
+    for butikskod, target_file in file_map.items():
+        store_inputs = []
+        for (data, _), index in zip(per_store_inputs, indexes):
+            if data is None:
+                store_inputs.append(None)
+            else:
+                store_inputs.append(data.take(index.get(butikskod, [])))
+
+        jobs.append(
+            (
+                {butikskod: target_file},
+                store_inputs,
+                presentkort_sålda_data,
+                last_sales_row,
+            )
+        )
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for target_file, lines in zip(file_map.values(), executor.map(export_store, jobs)):
+            sink.write_lines(target_file, lines)
+
+def export_store(job):
+    """Process pool worker: the 03 to 12 lines of a single store file."""
+    store_file_map, store_inputs, presentkort_sålda_data, last_sales_row = job
+    (
+        forsäljning_data,
+        betalsätt_data,
+        följesedlar_data,
+        presentkort_data,
+        moms_data,
+    ) = store_inputs
+
+    store_sink = OutputSink(store_file_map)
+    export_records(
+        store_file_map,
+        store_sink,
+        forsäljning_data,
+        betalsätt_data,
+        följesedlar_data,
+        presentkort_data,
+        moms_data,
+        presentkort_sålda_data,
+        last_sales_row,
+    )
+
+    (target_file,) = store_file_map.values()
+    return store_sink.buffers[target_file]
+
+def accumulate_sales_chunks(chunks, spill_folder=None):
+    """
+    Folds the Försäljning chunks into a SalesRecordAccumulator, which keeps
+    the 06 lines in spill_folder when it is given.
+
+    Returns the accumulator, the zero-padded butikskoder in order of first
+    appearance and the sales date of the first row, which is what
+    create_resulting_files takes from the whole Försäljning data.
+    """
+    accumulator = SalesRecordAccumulator(spill_folder)
+    butikskoder = {}
+    sales_date = None
+
+    for chunk in chunks:
+        count_input(len(chunk))
+        if sales_date is None and not chunk.empty:
+            sales_date = chunk.iloc[0]["Dok.datum"]
+
+        chunk_butikskoder = chunk["ButikskodWinbag"].astype(str).str.zfill(2).unique()
+        for butikskod in chunk_butikskoder:
+            butikskoder.setdefault(butikskod)
+
+        # A row belongs to a store only if its butikskod is already zero-padded,
+        # so the chunk's own butikskoder give the same rows as the whole file_map
+        index = build_partition_index(
+            chunk["ButikskodWinbag"], dict.fromkeys(chunk_butikskoder)
+        )
+        accumulator.add(chunk, index)
+
+    return accumulator, list(butikskoder), sales_date
+
+def create_resulting_files(forsäljning_data, target_folder):
     sales_date = forsäljning_data.iloc[0]["Dok.datum"]
-    time = datetime.now(ZoneInfo("Europe/Stockholm")).strftime("%H%M")
-    formatted_sales_date = format_sales_date(sales_date)
 
     butikskoder = (
         forsäljning_data["ButikskodWinbag"]
@@ -128,12 +572,22 @@ def create_resulting_files(forsäljning_data, target_folder):
         .unique()
     )
 
+    return create_file_map(butikskoder, sales_date, target_folder)
+
+def create_file_map(butikskoder, sales_date, target_folder):
+    file_map = {}
+
+    if not os.path.exists(target_folder):
+        os.makedirs(target_folder)
+
+    time = datetime.now(ZoneInfo("Europe/Stockholm")).strftime("%H%M")
+    formatted_sales_date = format_sales_date(sales_date)
+
     for butikskod in butikskoder:
         file_name = f"{butikskod}_000_{formatted_sales_date}_{time}.TXT"
         file_path = os.path.join(target_folder, file_name)
 
-        open(file_path, "w").close()
-
+        # The file itself is created when the export's OutputSink is flushed
         file_map[butikskod] = file_path
 
     return file_map
@@ -161,16 +615,31 @@ def map_serie_to_file_name(serie_value, butikskod_serie_map):
 
     return f"{butikskod_value}"
 
-def data_00(file_map):
-    header_row = ["00", "20250111_001", "1.0.0"]
+def write_records(file_data, sink=None):
+    """
+    Appends the rows for each target file, quoting every value. With a sink
+    the rows are buffered and written when the sink is flushed.
+    """
+    if sink is not None:
+        sink.write_rows(file_data)
+        return
 
-    for target_file in file_map.values():
-        # Append the header row to each file
+    for target_file, rows in file_data.items():
+        lines = encode_rows(rows)
         with open(target_file, "a") as f:
-            quoted_row = [f'"{value}"' for value in header_row]
-            f.write(",".join(quoted_row) + "\n")
+            start = f.tell()
+            f.writelines(lines)
+            size = f.tell() - start
+        if is_recording():
+            count_output(len(lines), size)
 
-def data_01_02(följesedlar_data, file_map):
+def data_00(file_map, sink=None):
+    header_row = ["00", "20250111_001", "1.0.0"]
+
+    # Append the header row to each file
+    write_records({target_file: [header_row] for target_file in file_map.values()}, sink)
+
+def data_01_02(följesedlar_data, file_map, sink=None):
     file_data = {}
     current_number = None
 
@@ -199,7 +668,7 @@ def data_01_02(följesedlar_data, file_map):
             #print(f"Shop ID: {shop_id}")
             customer_id = first_row["Kundkod"]
             date = first_row["Dok.datum"]
-            date = datetime.strptime(date, "%d/%m/%Y").strftime("%Y-%m-%d")
+            date = format_datum(date)
             receipt_id = first_row["Nummer"]
             seller_id = first_row["Anställd"]
 
@@ -261,14 +730,9 @@ def data_01_02(följesedlar_data, file_map):
         )
 
     # Write each set of rows to its corresponding file
-    for target_file, rows in file_data.items():
-        with open(target_file, "a") as f:
-            for row in rows:
-                # Add quotes around each value
-                quoted_row = [f'"{value}"' for value in row]
-                f.write(",".join(quoted_row) + "\n")
+    write_records(file_data, sink)
 
-def data_03(försäljning_data, file_map):
+def data_03(försäljning_data, file_map, sink=None):
     file_data = {}
 
     for _, row in försäljning_data.iterrows():
@@ -282,7 +746,7 @@ def data_03(försäljning_data, file_map):
         butiks_nr = row["ButikskodWinbag"]
         kassa_nr = row["ButikskodWinbag"]
         raw_datum = row["Dok.datum"]
-        datum = datetime.strptime(raw_datum, "%d/%m/%Y").strftime("%Y-%m-%d")
+        datum = format_datum(raw_datum)
 
         mapped_row_03 = ["03", butiks_nr, kassa_nr, datum]
 
@@ -291,12 +755,9 @@ def data_03(försäljning_data, file_map):
             file_data[matching_file] = mapped_row_03
 
     # write once per file
-    for target_file, row in file_data.items():
-        with open(target_file, "a") as f:
-            quoted_row = [f'"{value}"' for value in row]
-            f.write(",".join(quoted_row) + "\n")
+    write_records({target_file: [row] for target_file, row in file_data.items()}, sink)
 
-def data_04(betalsätt_data, file_map, presentkort_sålda):
+def data_04(betalsätt_data, file_map, presentkort_sålda, sink=None):
     file_data = {}  # To store rows for each matching file
     betalmedel_sums = {}  # Store sums for each matching file and betalmedel
     processed_betalmedel_for_number = {}  # Track processed betalmedel per file and number
@@ -409,14 +870,9 @@ def data_04(betalsätt_data, file_map, presentkort_sålda):
             file_data[matching_file].append(mapped_row_04)
 
     # Write each set of rows to its corresponding file
-    for target_file, rows in file_data.items():
-        with open(target_file, "a") as f:
-            for row in rows:
-                # Add quotes around each value
-                quoted_row = [f'"{value}"' for value in row]
-                f.write(",".join(quoted_row) + "\n")
+    write_records(file_data, sink)
 
-def data_04_följesedlar(följesedlar_data, file_map):
+def data_04_följesedlar(följesedlar_data, file_map, sink=None):
     file_data = {}
     sums_per_file = {}
     processed_numbers_for_file = {}
@@ -482,13 +938,9 @@ def data_04_följesedlar(följesedlar_data, file_map):
 
         file_data[matching_file].append(mapped_row_04)
 
-    for target_file, rows in file_data.items():
-        with open(target_file, "a") as f:
-            for row in rows:
-                quoted_row = [f'"{value}"' for value in row]
-                f.write(",".join(quoted_row) + "\n")
+    write_records(file_data, sink)
 
-def data_04_presentkort(presentkort_data, file_map):
+def data_04_presentkort(presentkort_data, file_map, sink=None):
     file_data = {}
     sums_per_file = {}
     account_mapping = {}
@@ -559,14 +1011,9 @@ def data_04_presentkort(presentkort_data, file_map):
         file_data[matching_file].append(mapped_row_04)
 
     # Write each set of rows to its corresponding file
-    for target_file, rows in file_data.items():
-        with open(target_file, "a") as f:
-            for row in rows:
-                # Add quotes around each value
-                quoted_row = [f'"{value}"' for value in row]
-                f.write(",".join(quoted_row) + "\n")
+    write_records(file_data, sink)
 
-def data_05(försäljning_data, file_map):
+def data_05(försäljning_data, file_map, sink=None):
     file_data = {}
 
     for _, row in försäljning_data.iterrows():
@@ -580,7 +1027,7 @@ def data_05(försäljning_data, file_map):
         butiks_nr = row["ButikskodWinbag"]
         kassa_nr = row["ButikskodWinbag"]
         raw_datum = row["Dok.datum"]
-        datum = datetime.strptime(raw_datum, "%d/%m/%Y").strftime("%Y-%m-%d")
+        datum = format_datum(raw_datum)
 
         mapped_row_05 = ["05", butiks_nr, kassa_nr, datum]
 
@@ -589,11 +1036,9 @@ def data_05(försäljning_data, file_map):
             file_data[matching_file] = mapped_row_05
 
     # write once per file
-    for target_file, row in file_data.items():
-        with open(target_file, "a") as f:
-            f.write(",".join(f'"{v}"' for v in row) + "\n")
+    write_records({target_file: [row] for target_file, row in file_data.items()}, sink)
 
-def data_06(försäljning_data, file_map):
+def data_06(försäljning_data, file_map, sink=None):
     file_data = {}
 
     for _, row in försäljning_data.iterrows():
@@ -631,13 +1076,9 @@ def data_06(försäljning_data, file_map):
 
         file_data[matching_file].append(mapped_row_06)
 
-    for target_file, rows in file_data.items():
-        with open(target_file, "a") as f:
-            for row in rows:
-                quoted_row = [f'"{value}"' for value in row]
-                f.write(",".join(quoted_row) + "\n")
+    write_records(file_data, sink)
 
-def data_07(försäljning_data, file_map):
+def data_07(försäljning_data, file_map, sink=None):
     file_data = {}
 
     for _, row in försäljning_data.iterrows():
@@ -651,7 +1092,7 @@ def data_07(försäljning_data, file_map):
         butiks_nr = row["ButikskodWinbag"]
         kassa_nr = row["ButikskodWinbag"]
         raw_datum = row["Dok.datum"]
-        datum = datetime.strptime(raw_datum, "%d/%m/%Y").strftime("%Y-%m-%d")
+        datum = format_datum(raw_datum)
 
         mapped_row_07 = ["07", butiks_nr, kassa_nr, datum]
 
@@ -660,11 +1101,9 @@ def data_07(försäljning_data, file_map):
             file_data[matching_file] = mapped_row_07
 
     # write once per file
-    for target_file, row in file_data.items():
-        with open(target_file, "a") as f:
-            f.write(",".join(f'"{v}"' for v in row) + "\n")
+    write_records({target_file: [row] for target_file, row in file_data.items()}, sink)
 
-def data_08(försäljning_data, file_map):
+def data_08(försäljning_data, file_map, sink=None):
     file_data = {}
     varugrupp_data = {}
 
@@ -723,12 +1162,9 @@ def data_08(försäljning_data, file_map):
             if varugrupp != "NaN":
                 rows.append(mapped_row_08)
 
-        with open(target_file, "a") as f:
-            for row in rows:
-                quoted_row = [f'"{value}"' for value in row]
-                f.write(",".join(quoted_row) + "\n")
+    write_records(file_data, sink)
 
-def data_09(försäljning_data, file_map):
+def data_09(försäljning_data, file_map, sink=None):
 
     file_data = {}
 
@@ -743,19 +1179,16 @@ def data_09(försäljning_data, file_map):
         butiks_nr = row["ButikskodWinbag"]
         kassa_nr = row["ButikskodWinbag"]
         raw_datum = row["Dok.datum"]
-        datum = datetime.strptime(raw_datum, "%d/%m/%Y").strftime("%Y-%m-%d")
+        datum = format_datum(raw_datum)
 
         mapped_row_09 = ["09", butiks_nr, kassa_nr, datum]
 
         if matching_file not in file_data:
             file_data[matching_file] = mapped_row_09
 
-    for target_file, row in file_data.items():
-        with open(target_file, "a") as f:
-            quoted_row = [f'"{value}"' for value in row]
-            f.write(",".join(quoted_row) + "\n")
+    write_records({target_file: [row] for target_file, row in file_data.items()}, sink)
 
-def data_10(försäljning_data, file_map):
+def data_10(försäljning_data, file_map, sink=None):
     file_data = {}
     time_interval_data = {}
 
@@ -778,13 +1211,7 @@ def data_10(försäljning_data, file_map):
         if matching_file not in time_interval_data:
             time_interval_data[matching_file] = {}
 
-        hour, minute, _ = tid.split(":")
-        hour = int(hour)
-
-        start_time = f"{hour}.00"
-        end_time = f"{hour + 1}.00" if hour + 1 < 24 else "0.00"
-
-        time_interval = f"{start_time} - {end_time}"
+        time_interval = format_time_interval(tid)
 
         if time_interval not in time_interval_data[matching_file]:
             time_interval_data[matching_file][time_interval] = {
@@ -807,12 +1234,9 @@ def data_10(försäljning_data, file_map):
 
             file_data[target_file].append(mapped_row_10)
 
-        with open(target_file, "a") as f:
-            for row in file_data[target_file]:
-                quoted_row = [f'"{value}"' for value in row]
-                f.write(",".join(quoted_row) + "\n")
+    write_records(file_data, sink)
 
-def data_11(försäljning_data, file_map):
+def data_11(försäljning_data, file_map, sink=None):
 
     file_data = {}
 
@@ -827,7 +1251,7 @@ def data_11(försäljning_data, file_map):
         butiks_nr = row["ButikskodWinbag"]
         kassa_nr = row["ButikskodWinbag"]
         raw_datum = row["Dok.datum"]
-        datum = datetime.strptime(raw_datum, "%d/%m/%Y").strftime("%Y-%m-%d")
+        datum = format_datum(raw_datum)
 
         if matching_file not in file_data:
             file_data[matching_file] = []
@@ -835,12 +1259,9 @@ def data_11(försäljning_data, file_map):
         mapped_row_11 = ["11", butiks_nr, kassa_nr, datum]
         file_data[matching_file].append(mapped_row_11)
 
-    for target_file in file_data.keys():
-        with open(target_file, "a") as f:
-            quoted_row = [f'"{value}"' for value in mapped_row_11]
-            f.write(",".join(quoted_row) + "\n")
+    write_records({target_file: [mapped_row_11] for target_file in file_data}, sink)
 
-def data_12(moms_data, file_map):
+def data_12(moms_data, file_map, sink=None):
 
     file_data = {}
 
@@ -880,101 +1301,10 @@ def data_12(moms_data, file_map):
 
         file_data[matching_file].append(mapped_row_12)
 
-    for target_file, rows in file_data.items():
-        with open(target_file, "a") as f:
-            for row in rows:
-                quoted_row = [f'"{value}"' for value in row]
-                f.write(",".join(quoted_row) + "\n")
+    write_records(file_data, sink)
 
-def data_99(file_map):
+def data_99(file_map, sink=None):
     footer_row = ["99"]
 
-    for target_file in file_map.values():
-        # Append the footer row to each file
-        with open(target_file, "a") as f:
-            quoted_row = [f'"{value}"' for value in footer_row]
-            f.write(",".join(quoted_row) + "\n")
-
-def format_time(tid):
-    hour, minute, _ = tid.split(":")
-    return f"{hour}{minute}"
-
-def format_value_as_integer_string(value):
-    value_str = str(value).replace(",", ".")  # convert decimal comma
-
-    if "." in value_str:
-        parts = value_str.split(".")
-
-        # Join everything except last part = handles thousand separators
-        integer_part = "".join(parts[:-1])
-        decimal_part = parts[-1]
-
-        # Ensure exactly 2 decimal digits
-        decimal_part = decimal_part.ljust(2, "0")[:2]
-
-        formatted_value = integer_part + decimal_part
-    else:
-        formatted_value = value_str + "00"
-
-    return formatted_value
-
-def format_antal_as_integer_string(value):
-    value_str = str(value).replace(",", ".")  # In case commas are used for decimals
-    if "." in value_str:
-        # Remove the decimal and append missing digits if necessary
-        integer_part, decimal_part = value_str.split(".")
-        decimal_part = decimal_part.ljust(2, "0")  # Ensure at least 2 digits
-        formatted_value = integer_part + decimal_part
-    else:
-        # No decimal point, just add "000"
-        formatted_value = value_str + "000"
-
-    return formatted_value
-
-def format_rabatt_nr(rabatt_nr):
-    if rabatt_nr == 0:
-        return "000"
-    elif 1 <= rabatt_nr <= 9:
-        return f"00{rabatt_nr}"
-    elif 10 <= rabatt_nr <= 99:
-        return f"0{rabatt_nr}"
-    else:
-        return str(rabatt_nr)
-
-def format_sales_date(sales_date):
-    
-    # Parse the combined date and time string into a datetime object
-    date_obj = datetime.strptime(sales_date, "%d/%m/%Y")
-    
-    # Format the datetime object into the desired format: YYMMDD_HHMM
-    return date_obj.strftime("%y%m%d")
-
-def smart_parse_amount(amount):
-    """Parses strings like '1.490', '1,490', '1490', etc. intelligently."""
-    s = str(amount).strip()
-
-    # European style: comma as decimal separator
-    if "," in s:
-        return Decimal(s.replace(".", "").replace(",", "."))
-
-    # Dot is present
-    elif "." in s:
-        parts = s.split(".")
-        if len(parts[-1]) == 3 and len(parts[0]) <= 3:
-            # Dot is probably a thousands separator: '1.490' → 1490
-            return Decimal(s.replace(".", "").replace(",", "."))
-        elif len(parts[-1]) == 2:
-            # Looks like decimal part: '1.49' → 1.49
-            return Decimal(s)
-        else:
-            # Defensive fallback
-            try:
-                return Decimal(s)
-            except ValueError:
-                print(f"⚠️ Failed to parse amount: {s}")
-                return Decimal(0)
-
-    # No dot or comma — just a raw number
-    return Decimal(s)
-
-
+    # Append the footer row to each file
+    write_records({target_file: [footer_row] for target_file in file_map.values()}, sink)
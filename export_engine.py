@@ -0,0 +1,721 @@
+import math
+import os
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from formatting import (
+    format_datum,
+    format_time,
+    format_time_interval,
+    format_value_as_integer_string,
+    format_antal_as_integer_string,
+    format_rabatt_nr,
+    format_amount_column,
+    format_öre_as_integer_string,
+    format_öre_column,
+    map_unique,
+    parse_amount_column_as_öre,
+)
+from output_sink import encode_columns, SpilledLines
+
+
+SALES_RECORD_TYPES = ["03", "05", "06", "07", "08", "09", "10", "11"]
+
+def build_partition_index(butikskoder, file_map):
+    """
+    Maps each zero-padded butikskod in file_map to the positions of its rows,
+    in order of first appearance.
+
+    Like the file_map.get(row["ButikskodWinbag"]) lookups in the data_XX
+    builders, a row only belongs to a store if its butikskod is exactly a key
+    of file_map.
+    """
+    codes, uniques = pd.factorize(butikskoder)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+    index = {}
+    for code, butikskod in enumerate(uniques):
+        if butikskod in file_map:
+            index[butikskod] = order[bounds[code]:bounds[code + 1]]
+    return index
+
+
+def build_sales_records(försäljning_data, file_map, index, last_row=None):
+    """
+    Builds the 03, 05, 06, 07, 08, 09, 10 and 11 records in one pass over the
+    Försäljning data. 08 and 10 are aggregated with a groupby instead.
+
+    last_row is the (ButikskodWinbag, Dok.datum, Moms) of the last matching
+    row, see find_last_sales_row. It defaults to the last row in index.
+
+    Returns a dict keyed by record type, where each value maps a target file to
+    the rows that data_03 ... data_11 would have appended to it. The 06 rows
+    are returned as encoded lines.
+    """
+    accumulator = SalesRecordAccumulator()
+    accumulator.add(försäljning_data, index)
+    return accumulator.records(file_map, last_row)
+
+
+class SalesRecordAccumulator:
+    """
+    Collects the 03, 05, 06, 07, 08, 09, 10 and 11 records of Försäljning data
+    that is added one part at a time, e.g. the chunks of a file read with
+    chunksize, so only one part has to be in memory.
+
+    The 06 lines are kept encoded and 08 and 10 as running sums per store, so
+    what is kept grows with the output and not with the input. With a
+    spill_folder the 06 lines of each store are appended to a file in it as
+    SpilledLines, so only those of the part being added are in memory.
+    """
+
+    def __init__(self, spill_folder=None):
+        self.spill_folder = spill_folder
+        self.headers = {}
+        self.lines_06 = {}
+        self.sums_08 = {}
+        self.sums_10 = {}
+        self.last_row = None
+
+    def add(self, försäljning_data, index):
+        """Adds the rows in index, a build_partition_index of försäljning_data."""
+        if not index:
+            return
+
+        self.last_row = find_last_sales_row(försäljning_data, index)
+
+        # Only rows that belong to a store are converted, like in data_03 ... data_11
+        matched_positions = np.sort(np.concatenate(list(index.values())))
+        matched = försäljning_data.take(matched_positions)
+
+        butikskoder = matched["ButikskodWinbag"].to_numpy(dtype=object)
+        datums = matched["Dok.datum"].to_numpy(dtype=object)
+        varugrupper = map_unique(matched["Varugruppskod"], normalize_varugrupp)
+        intervals = map_unique(matched["Timme"], format_time_interval)
+        antal = map_unique(matched["Enh.1"], int, dtype=np.int64)
+        sign = np.where(matched["Kod för dokumenttyp"].to_numpy() == 3, -1, 1)
+        netto = matched["Netto"].to_numpy(dtype=object)
+        netto_öre = parse_amount_column_as_öre(netto)
+
+        # 06 lines of every matched row, Enh.1 negated for Kod för dokumenttyp 3
+        enh = matched["Enh.1"].to_numpy(dtype=object)
+        antal_06 = map_unique(enh, format_antal_as_integer_string)
+        returns = sign < 0
+        antal_06[returns] = map_unique(
+            enh[returns], lambda antal_value: format_antal_as_integer_string(-antal_value)
+        )
+        lines_06 = np.array(
+            encode_columns(
+                [
+                    "06",
+                    matched["Referens"].to_numpy(dtype=object),
+                    antal_06,
+                    format_amount_column(matched["Pris "]),
+                    map_unique(matched["Timme"], format_time),
+                    matched["Anställd"].to_numpy(dtype=object),
+                    map_unique(
+                        matched["Moms"],
+                        lambda moms: moms.replace("%", "00").replace(" ", ""),
+                    ),
+                ]
+            ),
+            dtype=object,
+        )
+
+        for butikskod, store_positions in index.items():
+            positions = np.searchsorted(matched_positions, store_positions)
+
+            if butikskod not in self.headers:
+                first = positions[0]
+                self.headers[butikskod] = [
+                    butikskoder[first],
+                    butikskoder[first],
+                    format_datum(datums[first]),
+                ]
+            if butikskod not in self.lines_06:
+                self.lines_06[butikskod] = (
+                    []
+                    if self.spill_folder is None
+                    else SpilledLines(
+                        os.path.join(self.spill_folder, f"06_{len(self.lines_06)}.txt")
+                    )
+                )
+            self.lines_06[butikskod].extend(lines_06[positions].tolist())
+
+            store_netto_öre = None if netto_öre is None else netto_öre[positions]
+
+            # 08: sign flipped for Kod för dokumenttyp 3
+            add_group_sums(
+                self.sums_08.setdefault(butikskod, {}),
+                varugrupper[positions],
+                antal[positions],
+                netto[positions],
+                store_netto_öre,
+                sign[positions],
+            )
+
+            # 10: no sign flip
+            add_group_sums(
+                self.sums_10.setdefault(butikskod, {}),
+                intervals[positions],
+                antal[positions],
+                netto[positions],
+                store_netto_öre,
+            )
+
+    def records(self, file_map, last_row=None):
+        """
+        The records of everything added so far, in the format of
+        build_sales_records. last_row defaults to the last matching row added.
+        """
+        records = {record_type: {} for record_type in SALES_RECORD_TYPES}
+
+        if not self.headers:
+            return records
+
+        # 08 and 11 carry the Moms and date of the last matching row of the whole
+        # Försäljning data, exactly like data_08 and data_11 do
+        if last_row is None:
+            last_row = self.last_row
+        last_butikskod, raw_last_datum, raw_last_moms = last_row
+        last_datum = format_datum(raw_last_datum)
+        last_moms = raw_last_moms.replace("%", "00").replace(" ", "")
+
+        for butikskod, header in self.headers.items():
+            matching_file = file_map[butikskod]
+
+            for record_type in ("03", "05", "07", "09"):
+                records[record_type][matching_file] = [[record_type] + header]
+
+            records["06"][matching_file] = self.lines_06[butikskod]
+
+            # 08: rows without varugrupp left out
+            records["08"][matching_file] = [
+                [
+                    "08",
+                    varugrupp,
+                    format_antal_as_integer_string(antal_sum),
+                    format_total_pris(total_pris),
+                    last_moms,
+                ]
+                for varugrupp, (antal_sum, total_pris) in self.sums_08[butikskod].items()
+                if varugrupp != "NaN"
+            ]
+
+            records["10"][matching_file] = [
+                [
+                    "10",
+                    time_interval,
+                    format_value_as_integer_string(antal_sum),
+                    format_total_pris(total_pris),
+                ]
+                for time_interval, (antal_sum, total_pris) in self.sums_10[butikskod].items()
+            ]
+
+            records["11"][matching_file] = [
+                ["11", last_butikskod, last_butikskod, last_datum]
+            ]
+
+        return records
+
+
+def find_last_sales_row(försäljning_data, index):
+    """
+    (ButikskodWinbag, Dok.datum, Moms) of the last Försäljning row that belongs
+    to a store, or None if no row does.
+    """
+    if not index:
+        return None
+
+    last_position = max(positions[-1] for positions in index.values())
+    last_row = försäljning_data.iloc[last_position]
+    return last_row["ButikskodWinbag"], last_row["Dok.datum"], last_row["Moms"]
+
+
+def add_group_sums(sums, keys, antal, netto, netto_öre, sign=1):
+    """
+    Adds int(Enh.1) and Netto per key to sums, {key: [antal, total_pris]} in
+    the order in which each key first appears.
+
+    Netto is summed with a groupby as integer öre, or as Decimal if netto_öre
+    is None because a value is not a plain two-decimal amount. A total_pris
+    stays in öre until a Decimal is added to it.
+    """
+    if netto_öre is None:
+        group_sums = sum_per_group_decimal(keys, antal, netto, sign)
+    else:
+        frame = pd.DataFrame(
+            {"key": keys, "antal": antal * sign, "öre": netto_öre * sign}
+        )
+        grouped = frame.groupby("key", sort=False).sum()
+        group_sums = zip(
+            grouped.index, grouped["antal"].tolist(), grouped["öre"].tolist()
+        )
+
+    for key, antal_sum, total_pris in group_sums:
+        group = sums.setdefault(key, [0, 0])
+        group[0] += antal_sum
+        if isinstance(total_pris, Decimal) or isinstance(group[1], Decimal):
+            group[1] = öre_as_decimal(group[1]) + öre_as_decimal(total_pris)
+        else:
+            group[1] += total_pris
+
+
+def sum_per_group_decimal(keys, antal, netto, sign):
+    """Exact Decimal fallback of add_group_sums, returns [(key, antal, total_pris), ...]."""
+    sums = {}
+    for key, antal_value, netto_value, sign_value in zip(
+        keys.tolist(),
+        antal.tolist(),
+        netto.tolist(),
+        np.broadcast_to(sign, len(keys)).tolist(),
+    ):
+        pris = Decimal(netto_value.replace(".", "").replace(",", "."))
+        if sign_value < 0:
+            antal_value = -antal_value
+            pris = -pris
+
+        group = sums.setdefault(key, [0, 0])
+        group[0] += antal_value
+        group[1] += pris
+
+    return [(key, antal_sum, total_pris) for key, (antal_sum, total_pris) in sums.items()]
+
+
+def öre_as_decimal(total_pris):
+    if isinstance(total_pris, Decimal):
+        return total_pris
+    return Decimal(total_pris) / 100
+
+
+def format_total_pris(total_pris):
+    if isinstance(total_pris, Decimal):
+        return format_value_as_integer_string(total_pris)
+    return format_öre_as_integer_string(total_pris)
+
+
+def normalize_varugrupp(varugrupp):
+    if varugrupp and not math.isnan(float(varugrupp)):
+        return int(float(varugrupp))
+    return "NaN"
+
+
+def build_payment_records(betalsätt_data, file_map, index, presentkort_sålda):
+    """
+    04 rows per Betalmedel, like data_04, settled column by column with Belopp
+    parsed as integer öre.
+
+    A receipt's (Nummer, Betalmedel, Belopp) only counts once per store, so
+    the rows are deduplicated on (store, Nummer, Betalmedel, Belopp) before
+    debet (Kod för dokumenttyp 1) and kredit (3) are summed with a groupby.
+    The Presentkort_sold totals per Betalmedel are added to the debet once for
+    every row of that Betalmedel, as data_04 does.
+
+    Returns None if an amount needs the Decimal parsing of data_04.
+    """
+    if presentkort_sålda is None:
+        print("Warning: 'Presentkort_sold.csv' data is missing. Skipping presentkort_sold processing.")
+        sålda_per_betalmedel = None
+    else:
+        sålda_per_betalmedel = sum_presentkort_sålda(presentkort_sålda)
+        if sålda_per_betalmedel is None:
+            return None
+
+    warn_unmatched(betalsätt_data["ButikskodWinbag"], index)
+
+    accumulator = PaymentRecordAccumulator()
+    if not accumulator.add(betalsätt_data, index):
+        return None
+    return accumulator.records(file_map, sålda_per_betalmedel)
+
+
+def sum_presentkort_sålda(presentkort_sålda):
+    """
+    The öre of the sold gift cards per Betalmedel, only those with a
+    Kundkortskod counted, or None if an amount needs Decimal parsing.
+    """
+    sålda_öre = parse_amount_column_as_öre(presentkort_sålda["Belopp"])
+    if sålda_öre is None:
+        return None
+
+    sålda = pd.DataFrame(
+        {
+            "betalmedel": presentkort_sålda["Betalmedel"].to_numpy(dtype=object),
+            "öre": sålda_öre,
+        }
+    )
+    with_kort = np.array(
+        [str(kort) != "nan" for kort in presentkort_sålda["Kundkortskod"].tolist()],
+        dtype=bool,
+    )
+    return sålda[with_kort].groupby("betalmedel", sort=False, dropna=False)["öre"].sum()
+
+
+class PaymentRecordAccumulator:
+    """
+    Collects the 04 rows per Betalmedel of Betalsätt data that is added one
+    part at a time, like SalesRecordAccumulator does for Försäljning.
+
+    Keeps the konto, debet, kredit and number of rows per store and
+    Betalmedel. When the parts are separate snapshots, counted is the set of
+    (butikskod, Nummer, Betalmedel, öre) already summed, so a payment is
+    counted once across the parts as well. It is not tracked otherwise.
+    """
+
+    def __init__(self, counted=None):
+        self.sums = {}
+        self.counted = counted
+
+    def add(self, betalsätt_data, index):
+        """
+        Adds the rows in index, a build_partition_index of betalsätt_data.
+        Returns False, adding nothing, if an amount needs the Decimal parsing
+        of data_04.
+        """
+        belopp_öre = parse_amount_column_as_öre(betalsätt_data["Belopp"], smart=True)
+        if belopp_öre is None:
+            return False
+        if not index:
+            return True
+
+        butikskoder = list(index)
+        positions = np.concatenate(list(index.values()))
+        payments = pd.DataFrame(
+            {
+                "store": np.repeat(
+                    np.arange(len(butikskoder)), [len(rows) for rows in index.values()]
+                ),
+                "nummer": betalsätt_data["Nummer"].to_numpy()[positions],
+                "betalmedel": betalsätt_data["Betalmedel"].to_numpy(dtype=object)[positions],
+                "öre": belopp_öre[positions],
+                "kod": betalsätt_data["Kod för dokumenttyp"].to_numpy()[positions],
+                "konto": betalsätt_data["Bokföringssuffix"].to_numpy(dtype=object)[positions],
+            }
+        )
+
+        # One 04 row per store and Betalmedel, numbered in order of first appearance
+        group = (
+            payments.groupby(["store", "betalmedel"], sort=False, dropna=False)
+            .ngroup()
+            .to_numpy()
+        )
+        _, first_rows = np.unique(group, return_index=True)
+
+        # Rows without Nummer never match another row, like NaN in data_04's set
+        without_nummer = payments["nummer"].isna().to_numpy()
+        counted = (
+            ~payments.duplicated(["store", "nummer", "betalmedel", "öre"]).to_numpy()
+            | without_nummer
+        )
+        if self.counted is not None:
+            keys = [
+                (butikskoder[store], normalize_nummer(nummer), betalmedel, öre)
+                for store, nummer, betalmedel, öre in zip(
+                    payments["store"].tolist(),
+                    payments["nummer"].tolist(),
+                    payments["betalmedel"].tolist(),
+                    payments["öre"].tolist(),
+                )
+            ]
+            for position in np.flatnonzero(counted & ~without_nummer):
+                if keys[position] in self.counted:
+                    counted[position] = False
+                else:
+                    self.counted.add(keys[position])
+
+        settled = pd.DataFrame(
+            {
+                "group": group[counted],
+                "debet": payments["öre"].where(payments["kod"] == 1, 0)[counted].to_numpy(),
+                "kredit": payments["öre"].abs().where(payments["kod"] == 3, 0)[counted].to_numpy(),
+            }
+        )
+        sums = settled.groupby("group").sum().reindex(np.arange(len(first_rows)), fill_value=0)
+
+        for store, betalmedel, konto, debet, kredit, rows in zip(
+            payments["store"].to_numpy()[first_rows].tolist(),
+            payments["betalmedel"].to_numpy()[first_rows].tolist(),
+            payments["konto"].to_numpy()[first_rows].tolist(),
+            sums["debet"].tolist(),
+            sums["kredit"].tolist(),
+            np.bincount(group).tolist(),
+        ):
+            store_sums = self.sums.setdefault(butikskoder[store], {})
+            if betalmedel in store_sums:
+                store_sums[betalmedel][1:] = [
+                    store_sums[betalmedel][1] + debet,
+                    store_sums[betalmedel][2] + kredit,
+                    store_sums[betalmedel][3] + rows,
+                ]
+            else:
+                store_sums[betalmedel] = [konto, debet, kredit, rows]
+        return True
+
+    def records(self, file_map, sålda_per_betalmedel=None):
+        """
+        The 04 records of everything added so far, with the Presentkort_sold
+        totals of sum_presentkort_sålda added to the debet.
+        """
+        records = {}
+        for butikskod, store_sums in self.sums.items():
+            betalmedel = list(store_sums)
+            konto = [values[0] for values in store_sums.values()]
+            debet = np.array([values[1] for values in store_sums.values()], dtype=np.int64)
+            kredit = np.array([values[2] for values in store_sums.values()], dtype=np.int64)
+            rows = np.array([values[3] for values in store_sums.values()], dtype=np.int64)
+            if sålda_per_betalmedel is not None:
+                debet = debet + (
+                    sålda_per_betalmedel.reindex(betalmedel).fillna(0).to_numpy(dtype=np.int64)
+                    * rows
+                )
+
+            records[file_map[butikskod]] = [
+                ["04", konto_04, betalmedel_04, debet_öre, kredit_öre]
+                for konto_04, betalmedel_04, debet_öre, kredit_öre in zip(
+                    konto, betalmedel, format_öre_column(debet), format_öre_column(kredit)
+                )
+            ]
+        return records
+
+
+def normalize_nummer(nummer):
+    """Nummer as the same string whether it was read as an int or a float."""
+    if isinstance(nummer, float) and nummer.is_integer():
+        return str(int(nummer))
+    return str(nummer)
+
+
+def build_följesedlar_records(följesedlar_data, file_map):
+    """
+    The 01 and 02 rows of data_01_02, built column by column instead of per
+    receipt and row.
+
+    Receipts come in Nummer order and their rows in file order, like the
+    groupby("Nummer") of data_01_02. The Benämning of the first row of a
+    receipt without Referens becomes the reference of its 01 row.
+    """
+    if följesedlar_data is None:
+        print(
+            "Warning: 'Följesedlar.csv' data is missing. Skipping följesedlar processing."
+        )
+        return {}
+
+    # Rows sorted by receipt, rows without Nummer are left out like in a groupby
+    codes, _ = pd.factorize(följesedlar_data["Nummer"], sort=True)
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    if len(order) == 0:
+        return {}
+
+    data = följesedlar_data.take(order)
+    receipts = codes[order]
+    starts = np.flatnonzero(np.r_[True, receipts[1:] != receipts[:-1]])
+
+    referens = data["Referens"].to_numpy(dtype=object)
+    missing = (data["Referens"].isna() | (data["Referens"] == "")).to_numpy()
+
+    # Benämning of the first row without Referens of each receipt
+    references = np.full(len(starts), "", dtype=object)
+    missing_positions = np.flatnonzero(missing)
+    missing_receipts, first_missing = np.unique(
+        receipts[missing_positions], return_index=True
+    )
+    references[missing_receipts] = data["Benämning"].to_numpy(dtype=object)[
+        missing_positions[first_missing]
+    ]
+
+    shop_ids = data["ButikskodWinbag"].to_numpy(dtype=object)[starts]
+    customer_ids = data["Kundkod"].to_numpy(dtype=object)[starts]
+    receipt_ids = data["Nummer"].to_numpy(dtype=object)[starts]
+    seller_ids = data["Anställd"].to_numpy(dtype=object)[starts]
+    butikskoder = map_unique(shop_ids, lambda shop_id: str(shop_id).zfill(2))
+
+    matching_files = [file_map.get(butikskod) for butikskod in butikskoder]
+    matched = np.array([matching_file is not None for matching_file in matching_files])
+    for shop_id in shop_ids[~matched]:
+        print(f"Warning: No file found for serie {shop_id}. Skipping group.")
+
+    dates = map_unique(data["Dok.datum"].to_numpy(dtype=object)[starts[matched]], format_datum)
+
+    # 02 rows, only for rows with Referens in receipts that have a file
+    positions = np.flatnonzero(~missing & matched[receipts])
+    negative = np.where(data["Ant."].to_numpy()[positions] < 0, "-", "")
+    pris = negative + np.array(
+        format_amount_column(data["Pris "].to_numpy(dtype=object)[positions]), dtype=object
+    )
+    enhetspris = negative + map_unique(
+        data["EnhetsprisExMoms"].to_numpy(dtype=object)[positions],
+        lambda value: format_value_as_integer_string(
+            round(float(value.replace(",", ".")), 2)
+        ),
+    )
+    rows_02 = [
+        ["02", "0", article_id, antal, pris_02, enhetspris_02, moms, rabatt, enhetspris_02]
+        for article_id, antal, pris_02, enhetspris_02, moms, rabatt in zip(
+            referens[positions],
+            map_unique(
+                data["Ant."].to_numpy(dtype=object)[positions],
+                format_antal_as_integer_string,
+            ),
+            pris,
+            enhetspris,
+            map_unique(
+                data["Moms"].to_numpy(dtype=object)[positions],
+                lambda moms: moms.replace("%", "00").replace(" ", ""),
+            ),
+            map_unique(data["Rabatt"].to_numpy(dtype=object)[positions], format_rabatt_nr),
+        )
+    ]
+    bounds = np.searchsorted(receipts[positions], np.arange(len(starts) + 1))
+
+    file_data = {}
+    dates = iter(dates)
+    for receipt in np.flatnonzero(matched):
+        rows = file_data.setdefault(matching_files[receipt], [])
+        rows.append(
+            [
+                "01",
+                f"{shop_ids[receipt]}",
+                f"{shop_ids[receipt]}",
+                customer_ids[receipt],
+                next(dates),
+                references[receipt],
+                receipt_ids[receipt],
+                seller_ids[receipt],
+            ]
+        )
+        rows.extend(rows_02[bounds[receipt]:bounds[receipt + 1]])
+
+    return file_data
+
+
+def build_följesedlar_payment_records(följesedlar_data, file_map, index):
+    """
+    One 04 row per file with the Följesedlar Netto split into debet and
+    kredit, like data_04_följesedlar.
+
+    Returns None if an amount needs the Decimal parsing of data_04_följesedlar.
+    """
+    if följesedlar_data is None:
+        print(
+            "Warning: 'Följesedlar.csv' data is missing. Skipping följesedlar processing."
+        )
+        return {}
+
+    netto_öre = parse_amount_column_as_öre(följesedlar_data["Netto"], smart=True)
+    if netto_öre is None:
+        return None
+
+    warn_unmatched(följesedlar_data["ButikskodWinbag"], index)
+
+    konto = följesedlar_data["Bokföringssuffix"].to_numpy(dtype=object)
+
+    records = {}
+    for butikskod, positions in index.items():
+        store_öre = netto_öre[positions]
+        debet = store_öre[store_öre > 0].sum()
+        kredit = -store_öre[store_öre < 0].sum()
+
+        records[file_map[butikskod]] = [
+            [
+                "04",
+                konto[positions[0]],
+                "Följesedlar",
+                format_öre_as_integer_string(debet),
+                format_öre_as_integer_string(kredit),
+            ]
+        ]
+    return records
+
+
+def build_presentkort_records(presentkort_data, file_map, index):
+    """
+    One 04 row per file with the used gift card amounts, like
+    data_04_presentkort.
+
+    Returns None if an amount needs the Decimal parsing of data_04_presentkort.
+    """
+    if presentkort_data is None:
+        print(
+            "Warning: 'Presentkort_used.csv' data is missing. Skipping presentkort processing."
+        )
+        return {}
+
+    if not is_string_column(presentkort_data["Belopp"]):
+        return None
+
+    belopp_öre = parse_amount_column_as_öre(presentkort_data["Belopp"])
+    if belopp_öre is None:
+        return None
+
+    warn_unmatched(presentkort_data["ButikskodWinbag"], index)
+
+    used = presentkort_data["Kod för kundkortstransaktioner"].to_numpy() == 5
+    positive = np.where(used, np.abs(belopp_öre), 0)
+    konto = presentkort_data["Presentkortskonto"].to_numpy(dtype=object)
+
+    return {
+        file_map[butikskod]: [
+            [
+                "04",
+                konto[positions[0]],
+                "Presentkort",
+                "0",
+                format_öre_as_integer_string(positive[positions].sum()),
+            ]
+        ]
+        for butikskod, positions in index.items()
+    }
+
+
+def build_moms_records(moms_data, file_map, index):
+    """
+    12 rows, like data_12, with the amount columns formatted as whole columns.
+
+    Returns None if a column has values data_12 can't format.
+    """
+    amount_columns = ["Basbelopp", "Moms_2", "Totalbelopp"]
+    if not all(is_string_column(moms_data[column]) for column in ["Moms"] + amount_columns):
+        return None
+
+    moms = (
+        moms_data["Moms"]
+        .str.replace("%", "00", regex=False)
+        .str.replace(" ", "", regex=False)
+        .tolist()
+    )
+    columns = [np.array(moms, dtype=object)] + [
+        np.array(
+            format_amount_column(
+                moms_data[column]
+                .str.replace(".", "", regex=False)
+                .str.replace(",", ".", regex=False)
+            ),
+            dtype=object,
+        )
+        for column in amount_columns
+    ]
+
+    warn_unmatched(moms_data["ButikskodMomsWinbag"], index)
+
+    return {
+        file_map[butikskod]: [
+            ["12", moms, basbelopp, moms_2, total_belopp]
+            for moms, basbelopp, moms_2, total_belopp in zip(
+                *(column[positions] for column in columns)
+            )
+        ]
+        for butikskod, positions in index.items()
+    }
+
+
+def is_string_column(values):
+    return values.map(lambda value: isinstance(value, str)).all()
+
+
+def warn_unmatched(butikskoder, index):
+    for butikskod in butikskoder[~butikskoder.isin(list(index))].unique():
+        print(f"Warning: Butikskod {butikskod} not found in file_map. Skipping rows.")
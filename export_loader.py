@@ -0,0 +1,357 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+
+class InputSchema(NamedTuple):
+    """
+    How one input file of an export is read.
+
+    Only columns are loaded, those missing from a file are left out. required
+    are the columns the README lists for the file, they are checked before the
+    file is parsed. Columns with few distinct values are loaded as categoricals
+    through dtype.
+    """
+
+    name: str
+    marker: str
+    columns: list
+    required: list
+    dtype: dict
+
+
+# The pandas CSV engines an export can be loaded with. pyarrow parses a file on
+# several threads but is only used when it is installed
+CSV_ENGINES = ["c", "pyarrow"]
+
+# The input files of an export, in the order their names are matched
+EXPORT_INPUTS = [
+    InputSchema(
+        "forsäljning",
+        "Försäljning",
+        columns=[
+            "ButikskodWinbag",
+            "Dok.datum",
+            "Referens",
+            "Enh.1",
+            "Pris ",
+            "Timme",
+            "Anställd",
+            "Moms",
+            "Kod för dokumenttyp",
+            "Netto",
+            "Varugruppskod",
+            # Only used to tell the receipts apart in an incremental export
+            "Serie",
+            "Nummer",
+        ],
+        required=[
+            "Serie",
+            "Butikskod",
+            "ButikskodWinbag",
+            "KassaId",
+            "Dok.datum",
+            "Referens",
+            "Enh.1",
+            "Pris ",
+            "Timme",
+            "Anställd",
+            "Moms",
+            "Kod för dokumenttyp",
+            "Netto",
+            "Varugruppskod",
+        ],
+        dtype={
+            "Referens": str,
+            "Netto": str,
+            "ButikskodWinbag": "category",
+            "Dok.datum": "category",
+            "Moms": "category",
+            "Serie": "category",
+        },
+    ),
+    InputSchema(
+        "betalsätt",
+        "Betalsätt",
+        columns=[
+            "Serie",
+            "Nummer",
+            "ButikskodWinbag",
+            "Kod för dokumenttyp",
+            "Dok.Id",
+            "Betalmedel",
+            "Belopp",
+            "Bokföringssuffix",
+            # Only used to split an export by day, when the file has it
+            "Dok.datum",
+        ],
+        required=[
+            "Serie",
+            "Nummer",
+            "ButikskodWinbag",
+            "Kod för dokumenttyp",
+            "Dok.Id",
+            "Betalmedel",
+            "Belopp",
+            "Bokföringssuffix",
+        ],
+        dtype={
+            "Belopp": str,  # 👈 this preserves "1.490" as string
+            "ButikskodWinbag": "category",
+            "Dok.Id": "category",
+            "Betalmedel": "category",
+            "Dok.datum": "category",
+        },
+    ),
+    InputSchema(
+        "följesedlar",
+        "Följesedlar",
+        columns=[
+            "ButikskodWinbag",
+            "Nummer",
+            "Bokföringssuffix",
+            "Dok.Id",
+            "Netto",
+            "Referens",
+            "Benämning",
+            "Kundkod",
+            "Dok.datum",
+            "Anställd",
+            "Ant.",
+            "Pris ",
+            "EnhetsprisExMoms",
+            "Moms",
+            "Rabatt",
+        ],
+        required=[
+            "Serie",
+            "ButikskodWinbag",
+            "Nummer",
+            "Bokföringssuffix",
+            "Dok.Id",
+            "Netto",
+        ],
+        dtype={"Netto": str, "Referens": str, "ButikskodWinbag": str},
+    ),
+    InputSchema(
+        "moms",
+        "Moms",
+        columns=[
+            "ButikskodMomsWinbag",
+            "Moms",
+            "Basbelopp",
+            "Moms_2",
+            "Totalbelopp",
+            "Dok.datum",
+        ],
+        required=[
+            "Butikskod",
+            "ButikskodMomsWinbag",
+            "Moms",
+            "Basbelopp",
+            "Moms_2",
+            "Totalbelopp",
+        ],
+        dtype={"Totalbelopp": str, "Basbelopp": str, "ButikskodMomsWinbag": str},
+    ),
+    InputSchema(
+        "presentkort",
+        "Presentkort_used",
+        columns=[
+            "Butikskod",
+            "ButikskodWinbag",
+            "Presentkortskonto",
+            "Kod för kundkortstransaktioner",
+            "Belopp",
+            "Dok.datum",
+        ],
+        required=[
+            "Butikskod",
+            "Presentkortskonto",
+            "Kod för kundkortstransaktioner",
+            "Belopp",
+        ],
+        dtype={"Belopp": str, "ButikskodWinbag": str},
+    ),
+    InputSchema(
+        "presentkort_sålda",
+        "Presentkort_sold",
+        columns=["Kundkortskod", "Betalmedel", "Belopp", "Dok.datum"],
+        required=["Kort", "Betalmedel", "Belopp"],
+        dtype={"Belopp": str},
+    ),
+]
+
+
+class ExportInputs(NamedTuple):
+    """
+    The frames of one export, None for the files that were not given. When
+    loaded with a chunksize forsäljning is a reader that yields the chunks.
+    """
+
+    forsäljning: Optional[pd.DataFrame]
+    betalsätt: Optional[pd.DataFrame]
+    följesedlar: Optional[pd.DataFrame]
+    moms: Optional[pd.DataFrame]
+    presentkort: Optional[pd.DataFrame]
+    presentkort_sålda: Optional[pd.DataFrame]
+    timings: dict
+
+
+def match_export_inputs(file_paths):
+    """
+    Returns {name: (file_path, schema)} for the input files in file_paths.
+    When several paths match the same input the last one is used.
+    """
+    matched = {}
+    for file_path in file_paths:
+        file_name = os.path.basename(file_path)
+        for schema in EXPORT_INPUTS:
+            if schema.marker in file_name:
+                matched[schema.name] = (file_path, schema)
+                break
+    return matched
+
+
+def check_required_columns(file_path, schema):
+    """Returns the columns of the file, raises ValueError if a required one is missing."""
+    header = pd.read_csv(file_path, sep=";", encoding="ISO-8859-1", nrows=0)
+    missing = [column for column in schema.required if column not in header.columns]
+    if missing:
+        raise ValueError(
+            f"{os.path.basename(file_path)} is missing the columns: {', '.join(missing)}"
+        )
+    return list(header.columns)
+
+
+def read_input_csv(file_path, schema, engine="c", chunksize=None):
+    """
+    Parses an input file with the pandas CSV engine engine, see CSV_ENGINES.
+
+    The pyarrow engine can't stream chunks. When it is not installed or fails
+    on a file, the file is parsed with the C engine instead.
+    """
+    columns = check_required_columns(file_path, schema)
+    usecols = [column for column in columns if column in schema.columns]
+
+    if engine == "pyarrow" and chunksize is None:
+        if pyarrow is None:
+            print("Warning: pyarrow is not installed. Reading the input with the C engine.")
+        else:
+            try:
+                return pd.read_csv(
+                    file_path,
+                    sep=";",
+                    usecols=usecols,
+                    dtype=schema.dtype,
+                    encoding="ISO-8859-1",
+                    engine="pyarrow",
+                )
+            except Exception as e:
+                print(
+                    f"Warning: pyarrow could not read {os.path.basename(file_path)}: {e}. "
+                    "Reading it with the C engine."
+                )
+
+    return pd.read_csv(
+        file_path,
+        sep=";",
+        usecols=usecols,
+        dtype=schema.dtype,
+        encoding="ISO-8859-1",
+        chunksize=chunksize,
+    )
+
+
+def read_export_input(file_path, schema, chunksize=None, cache=None, engine="c"):
+    start = time.perf_counter()
+
+    # A streamed file is not cached, it is never parsed as a whole
+    key = None
+    if cache is not None and chunksize is None:
+        key = cache.key(file_path, schema, engine)
+        data = cache.load(key)
+        if data is not None:
+            return data, time.perf_counter() - start
+
+    data = read_input_csv(file_path, schema, engine, chunksize)
+    if key is not None:
+        cache.store(key, data)
+    return data, time.perf_counter() - start
+
+
+def load_export_inputs(
+    file_paths, max_workers=None, chunksize=None, cache=None, engine="c"
+):
+    """
+    Reads the input files of an export at the same time on a thread pool.
+
+    The C parser of pandas releases the GIL for most of its work, so the files
+    are parsed in parallel. Returns an ExportInputs with the seconds spent on
+    each file in timings.
+
+    With a chunksize the Försäljning file is not parsed here but opened for
+    reading that many rows at a time. With an InputCache, files that have been
+    parsed before are read from the cache. engine is the CSV engine the files
+    are parsed with, see read_input_csv.
+    """
+    matched = match_export_inputs(file_paths)
+    frames = {schema.name: None for schema in EXPORT_INPUTS}
+    timings = {}
+
+    if matched:
+        with ThreadPoolExecutor(max_workers=max_workers or len(matched)) as executor:
+            futures = {
+                name: executor.submit(
+                    read_export_input,
+                    file_path,
+                    schema,
+                    chunksize if name == "forsäljning" else None,
+                    cache,
+                    engine,
+                )
+                for name, (file_path, schema) in matched.items()
+            }
+            for name, future in futures.items():
+                frames[name], timings[name] = future.result()
+
+    return ExportInputs(timings=timings, **frames)
+
+
+def compare_csv_engines(file_paths, repeat=3):
+    """
+    Loads file_paths with every engine in CSV_ENGINES, for benchmarks.
+
+    Returns {engine: {name: seconds}} with the fastest of repeat loads of each
+    file, and the names of the inputs whose frames differ from the C engine's.
+    """
+    timings = {}
+    frames = {}
+    for engine in CSV_ENGINES:
+        timings[engine] = {}
+        for _ in range(repeat):
+            loaded = load_export_inputs(file_paths, engine=engine)
+            for name, seconds in loaded.timings.items():
+                timings[engine][name] = min(seconds, timings[engine].get(name, seconds))
+        frames[engine] = loaded
+
+    different = []
+    for schema in EXPORT_INPUTS:
+        expected = getattr(frames["c"], schema.name)
+        for engine in CSV_ENGINES[1:]:
+            actual = getattr(frames[engine], schema.name)
+            if expected is None or actual is None:
+                continue
+            if not (
+                expected.equals(actual) and expected.dtypes.equals(actual.dtypes)
+            ):
+                different.append(schema.name)
+    return timings, different
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+from folder_index import normalize_path
+
+
+def can_open_exclusively(file_path):
+    """
+    False while another process still has file_path open for writing. On
+    Windows a file can't be renamed while it is open without delete sharing,
+    which is how a copy or a WinBag export holds it. The file is only opened
+    for reading, so a read-only input passes once it is complete.
+    """
+    try:
+        with open(file_path, "rb"):
+            pass
+        if os.name == "nt":
+            os.rename(file_path, file_path)
+    except OSError:
+        return False
+    return True
+
+
+class FileReadiness:
+    """
+    Tells when a detected file has been written completely: its size and
+    mtime haven't changed for stable_seconds and it can be opened exclusively.
+
+    on_modified events restart the stable time of a file and on_closed events,
+    where the platform has them, make it ready at once. A file whose mtime is
+    already older than stable_seconds when it is first seen only has to pass
+    the open check, so a finished file is never waited for.
+    """
+
+    def __init__(self, stable_seconds=0.5, timeout=600, poll_seconds=0.25):
+        self.stable_seconds = stable_seconds
+        self.timeout = timeout
+        self.poll_seconds = poll_seconds
+        self.changed = threading.Condition()
+        # {normalized file path: ((size, mtime), monotonic time it has had them since)}
+        self.files = {}
+        self.closed = set()
+
+    def modified(self, file_path):
+        file_path = normalize_path(file_path)
+        with self.changed:
+            if file_path in self.files:
+                self.files[file_path] = (self.files[file_path][0], time.monotonic())
+            self.closed.discard(file_path)
+            self.changed.notify_all()
+
+    def closed_after_writing(self, file_path):
+        file_path = normalize_path(file_path)
+        with self.changed:
+            self.closed.add(file_path)
+            self.changed.notify_all()
+
+    def forget(self, file_path):
+        file_path = normalize_path(file_path)
+        with self.changed:
+            self.files.pop(file_path, None)
+            self.closed.discard(file_path)
+
+    def seconds_left(self, file_path):
+        """
+        Seconds until file_path can be ready at the earliest, 0 when it is
+        ready and None when it doesn't exist.
+        """
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+
+        file_path = normalize_path(file_path)
+        now = time.monotonic()
+        with self.changed:
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self.files.get(file_path)
+            if previous is None:
+                age = max(0.0, time.time() - stat.st_mtime)
+                self.files[file_path] = (signature, now - age)
+            elif previous[0] != signature:
+                self.files[file_path] = (signature, now)
+                self.closed.discard(file_path)
+            since = self.files[file_path][1]
+            closed = file_path in self.closed
+
+        left = 0.0 if closed else max(0.0, since + self.stable_seconds - now)
+        if left == 0.0 and not can_open_exclusively(file_path):
+            return self.poll_seconds
+        return left
+
+    def wait_until_ready(self, file_paths):
+        """
+        Waits until every file in file_paths is ready. Returns False if one of
+        them disappears or isn't ready within timeout seconds.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            waits = [self.seconds_left(file_path) for file_path in file_paths]
+            if any(wait is None for wait in waits):
+                return False
+            longest = max(waits, default=0.0)
+            if longest == 0.0:
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # An event for one of the files wakes the wait early
+            with self.changed:
+                self.changed.wait(min(longest, self.poll_seconds, remaining))
@@ -0,0 +1,73 @@
+import os
+import threading
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+class FolderIndex:
+    """
+    The files directly in folder whose names contain one of keywords, kept up
+    to date from file system events so a lookup doesn't list the folder.
+
+    The index is seeded by one scan, and scan can be run again to catch what
+    the events missed. Names are kept in the order they were found, which is
+    the os.listdir order for those of a scan.
+    """
+
+    def __init__(self, folder, keywords):
+        self.folder = folder
+        self.keywords = list(keywords)
+        self.lock = threading.Lock()
+        self.names = {}
+        self.normalized_folder = normalize_path(folder)
+        self.scan()
+
+    def matches(self, name):
+        return any(keyword in name for keyword in self.keywords)
+
+    def name_in_folder(self, path):
+        """The file name of path if it is directly in folder, else None."""
+        parent, name = os.path.split(normalize_path(path))
+        if parent != self.normalized_folder:
+            return None
+        # The case of the name as written, the normalized one may be lowercased
+        return os.path.basename(path)
+
+    def add(self, path):
+        """Adds a created or moved in file. Returns True if it is a candidate file."""
+        name = self.name_in_folder(path)
+        if name is None or not self.matches(name):
+            return False
+        with self.lock:
+            self.names[name] = None
+        return True
+
+    def remove(self, path):
+        name = self.name_in_folder(path)
+        if name is not None:
+            with self.lock:
+                self.names.pop(name, None)
+
+    def scan(self):
+        """Rebuilds the index from one os.listdir. Returns True if it had missed a change."""
+        names = dict.fromkeys(name for name in os.listdir(self.folder) if self.matches(name))
+        with self.lock:
+            changed = names.keys() != self.names.keys()
+            # Files already indexed keep their place
+            self.names = {
+                **{name: None for name in self.names if name in names},
+                **names,
+            }
+        return changed
+
+    def find(self, keywords):
+        """Paths of the indexed files whose names contain one of keywords."""
+        with self.lock:
+            names = list(self.names)
+        return [
+            os.path.join(self.folder, name)
+            for name in names
+            if any(keyword in name for keyword in keywords)
+        ]
@@ -0,0 +1,202 @@
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Plain amounts with at most two decimals, after Swedish separators have been
+# normalized. Anything else is left to the exact Decimal code path.
+PLAIN_AMOUNT_PATTERN = r"[+-]?\d{1,13}(?:\.\d{1,2})?"
+
+
+# The date and time helpers are cached, a day of sales only has a few distinct
+# dates and at most one Timme per second
+
+@lru_cache(maxsize=1024)
+def format_datum(raw_datum):
+    """Dok.datum as it is written in the records, "10/03/2025" → "2025-03-10"."""
+    return datetime.strptime(raw_datum, "%d/%m/%Y").strftime("%Y-%m-%d")
+
+@lru_cache(maxsize=4096)
+def format_time(tid):
+    hour, minute, _ = tid.split(":")
+    return f"{hour}{minute}"
+
+@lru_cache(maxsize=4096)
+def format_time_interval(tid):
+    hour, minute, _ = tid.split(":")
+    hour = int(hour)
+
+    start_time = f"{hour}.00"
+    end_time = f"{hour + 1}.00" if hour + 1 < 24 else "0.00"
+
+    return f"{start_time} - {end_time}"
+
+def format_value_as_integer_string(value):
+    value_str = str(value).replace(",", ".")  # convert decimal comma
+
+    if "." in value_str:
+        parts = value_str.split(".")
+
+        # Join everything except last part = handles thousand separators
+        integer_part = "".join(parts[:-1])
+        decimal_part = parts[-1]
+
+        # Ensure exactly 2 decimal digits
+        decimal_part = decimal_part.ljust(2, "0")[:2]
+
+        formatted_value = integer_part + decimal_part
+    else:
+        formatted_value = value_str + "00"
+
+    return formatted_value
+
+def format_antal_as_integer_string(value):
+    value_str = str(value).replace(",", ".")  # In case commas are used for decimals
+    if "." in value_str:
+        # Remove the decimal and append missing digits if necessary
+        integer_part, decimal_part = value_str.split(".")
+        decimal_part = decimal_part.ljust(2, "0")  # Ensure at least 2 digits
+        formatted_value = integer_part + decimal_part
+    else:
+        # No decimal point, just add "000"
+        formatted_value = value_str + "000"
+
+    return formatted_value
+
+def format_rabatt_nr(rabatt_nr):
+    if rabatt_nr == 0:
+        return "000"
+    elif 1 <= rabatt_nr <= 9:
+        return f"00{rabatt_nr}"
+    elif 10 <= rabatt_nr <= 99:
+        return f"0{rabatt_nr}"
+    else:
+        return str(rabatt_nr)
+
+def format_sales_date(sales_date):
+    
+    # Parse the combined date and time string into a datetime object
+    date_obj = datetime.strptime(sales_date, "%d/%m/%Y")
+    
+    # Format the datetime object into the desired format: YYMMDD_HHMM
+    return date_obj.strftime("%y%m%d")
+
+def smart_parse_amount(amount):
+    """Parses strings like '1.490', '1,490', '1490', etc. intelligently."""
+    s = str(amount).strip()
+
+    # European style: comma as decimal separator
+    if "," in s:
+        return Decimal(s.replace(".", "").replace(",", "."))
+
+    # Dot is present
+    elif "." in s:
+        parts = s.split(".")
+        if len(parts[-1]) == 3 and len(parts[0]) <= 3:
+            # Dot is probably a thousands separator: '1.490' → 1490
+            return Decimal(s.replace(".", "").replace(",", "."))
+        elif len(parts[-1]) == 2:
+            # Looks like decimal part: '1.49' → 1.49
+            return Decimal(s)
+        else:
+            # Defensive fallback
+            try:
+                return Decimal(s)
+            except ValueError:
+                print(f"⚠️ Failed to parse amount: {s}")
+                return Decimal(0)
+
+    # No dot or comma — just a raw number
+    return Decimal(s)
+
+def map_unique(values, func, dtype=object):
+    """
+    Applies func once per distinct value and broadcasts the results back to
+    every position, e.g. for columns that repeat the same few values.
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    mapped = np.array(
+        [func(value) for value in np.asarray(uniques, dtype=object)], dtype=dtype
+    )
+    return mapped[codes]
+
+def parse_amount_column_as_öre(values, smart=False):
+    """
+    Vectorized version of Decimal(value.replace(".", "").replace(",", "."))
+    that returns the amounts as int64 öre. With smart=True the values are
+    parsed like smart_parse_amount instead.
+
+    Returns None if any value is not a plain amount with at most two decimals,
+    in which case the caller has to fall back to Decimal.
+    """
+    # Amount columns repeat the same values a lot, so only the distinct values
+    # are parsed
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    if len(codes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    strings = pd.Series(
+        [str(value) for value in np.asarray(uniques, dtype=object)], dtype=object
+    )
+
+    if smart:
+        strings = strings.str.strip()
+        has_comma = strings.str.contains(",", regex=False)
+        has_dot = strings.str.contains(".", regex=False)
+        # '1.490' → 1490, but '1.49' and '1234.567' keep the dot as decimal point
+        thousands = (
+            has_dot
+            & ~has_comma
+            & (strings.str.rpartition(".")[2].str.len() == 3)
+            & (strings.str.partition(".")[0].str.len() <= 3)
+        )
+        without_dots = strings.str.replace(".", "", regex=False)
+        normalized = strings.where(
+            ~(has_comma | thousands), without_dots.str.replace(",", ".", regex=False)
+        )
+    else:
+        normalized = strings.str.replace(".", "", regex=False).str.replace(
+            ",", ".", regex=False
+        )
+
+    if not normalized.str.fullmatch(PLAIN_AMOUNT_PATTERN).all():
+        return None
+
+    öre = (pd.to_numeric(normalized).to_numpy(dtype=float) * 100).round().astype(np.int64)
+    return öre[codes]
+
+def format_öre_as_integer_string(öre):
+    """Same output as format_value_as_integer_string for an amount in öre."""
+    sign = "-" if öre < 0 else ""
+    kronor, rest = divmod(abs(int(öre)), 100)
+    return f"{sign}{kronor}{rest:02d}"
+
+def format_öre_column(öre):
+    """Vectorized format_öre_as_integer_string, returns a list of strings."""
+    öre = np.asarray(öre, dtype=np.int64)
+    kronor, rest = np.divmod(np.abs(öre), 100)
+    formatted = (
+        pd.Series(np.where(öre < 0, "-", ""), dtype=object)
+        + pd.Series(kronor).astype(str)
+        + pd.Series(rest).astype(str).str.zfill(2)
+    )
+    return formatted.tolist()
+
+def format_amount_column(values):
+    """
+    Vectorized format_value_as_integer_string, returns a list of strings.
+    Every distinct value is converted with str() and formatted once.
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    if len(codes) == 0:
+        return []
+
+    strings = pd.Series(
+        [str(value) for value in np.asarray(uniques, dtype=object)], dtype=object
+    ).str.replace(",", ".", regex=False)
+    parts = strings.str.rpartition(".")
+    integer_part = parts[0].str.replace(".", "", regex=False)
+    decimal_part = parts[2].str.ljust(2, "0").str[:2]
+    formatted = (integer_part + decimal_part).where(parts[1] == ".", strings + "00")
+    return formatted.to_numpy(dtype=object)[codes].tolist()
@@ -1,11 +1,23 @@
 import os
-import time
 import pytz
 import csv
+import threading
 from datetime import datetime
 
+from metrics import record_run, stage, count_input, count_output, timed
 
-def import_action(file_paths):
+OUTPUT_NAMES = ["file_01_11", "file_artiklar", "file_huvudgrupp", "file_varugrupp"]
+
+# Keeps two imports in the same process from picking the same output names
+output_names_lock = threading.Lock()
+
+
+def import_action(
+    file_paths,
+    metrics_file=None,
+    trace_memory=False,
+    import_folder=os.path.join("C:\\", "winbag_export", "Imported_Files"),
+):
     """
     Takes a list of file paths, expects exactly one 'pcs.adm' file,
     and splits its contents into four new files based on the rules:
@@ -15,9 +27,12 @@ def import_action(file_paths):
     3) '03' or '33'  --> check 6th column:
        - if empty    --> third output file
        - if not empty -> fourth output file
-    """
-    time.sleep(1)
 
+    With a metrics_file the time spent splitting the file and in each transform
+    is appended to it as one JSON line, see record_run for trace_memory.
+
+    The four files are written to import_folder.
+    """
     if not file_paths:
         print("No file paths provided to import_action.")
         return
@@ -29,25 +44,22 @@ def import_action(file_paths):
 
     # Define output file names in the same directory as pcs_file_path
     #base_dir = os.path.dirname(pcs_file_path)
-    import_folder = os.path.join("C:\\", "winbag_export", "Imported_Files")
 
     if not os.path.exists(import_folder):
-        os.makedirs(import_folder)
+        os.makedirs(import_folder, exist_ok=True)
         print(f"Created 'Imported Files' folder at {import_folder}")
 
     print(f"Resolved import folder path: {os.path.abspath(import_folder)}")
 
 
-    stockholm_tz = pytz.timezone("Europe/Stockholm")
-    current_time = datetime.now(stockholm_tz).strftime("%Y%m%d-%H-%M-%S")
-
-    output1_path = os.path.join(import_folder, f"file_01_11.{current_time}.csv")
-    output2_path = os.path.join(import_folder, f"file_artiklar.{current_time}.csv")
-    output3_path = os.path.join(import_folder, f"file_huvudgrupp.{current_time}.csv")
-    output4_path = os.path.join(import_folder, f"file_varugrupp.{current_time}.csv")
+    output1_path, output2_path, output3_path, output4_path = create_output_files(
+        import_folder
+    )
 
     try:
-        with open(pcs_file_path, "r", encoding="cp1252") as pcs_in, open(
+        with record_run("import", metrics_file, file_paths, trace_memory), stage("split"), open(
+            pcs_file_path, "r", encoding="cp1252"
+        ) as pcs_in, open(
             output1_path, "w", encoding="cp1252"
         ) as out1, open(output2_path, "w", encoding="cp1252") as out2, open(
             output3_path, "w", encoding="cp1252"
@@ -56,6 +68,7 @@ def import_action(file_paths):
         ) as out4:
 
             for line in pcs_in:
+                count_input(1)
                 # Remove trailing newline/spaces
                 clean_line = line.strip()
                 if not clean_line:
@@ -97,12 +110,44 @@ def import_action(file_paths):
                     # Passes 00 and 99
                     pass
 
+            # The records are counted by the transforms, the bytes written here
+            count_output(0, sum(out.tell() for out in (out1, out2, out3, out4)))
+
         print("import_action completed successfully.")
 
     except Exception as e:
         print(f"An error occurred in import_action: {e}")
 
 
+def create_output_files(import_folder):
+    """
+    Creates the four empty output files of an import in import_folder and
+    returns their paths. They are named by the current second, and when an
+    earlier import already used that second a _2, _3 and so on is added to it
+    so its files are not overwritten. The names still sort in import order.
+    """
+    stockholm_tz = pytz.timezone("Europe/Stockholm")
+    current_time = datetime.now(stockholm_tz).strftime("%Y%m%d-%H-%M-%S")
+
+    with output_names_lock:
+        suffix = ""
+        number = 1
+        while True:
+            output_paths = [
+                os.path.join(import_folder, f"{name}.{current_time}{suffix}.csv")
+                for name in OUTPUT_NAMES
+            ]
+            if not any(os.path.exists(output_path) for output_path in output_paths):
+                break
+            number += 1
+            suffix = f"_{number}"
+
+        for output_path in output_paths:
+            open(output_path, "x").close()
+    return output_paths
+
+
+@timed
 def transform_01_11(row):
     """
     Given a row like:
@@ -137,6 +182,7 @@ def transform_01_11(row):
     return f"{tf_value};{code};{name};{address};{desc}"
 
 
+@timed
 def transform_02_22(row):
     """
     Given a row like:
@@ -193,6 +239,7 @@ def transform_02_22(row):
     return f"{code};{name};{value_1};{value_2};{price};{tf_value};{price_2}"
 
 
+@timed
 def transform_huvudgrupp(row):
     """
     Transform huvudgrupp rows.
@@ -213,6 +260,7 @@ def transform_huvudgrupp(row):
     return f"{huvudgrupp_code};{name}"
 
 
+@timed
 def transform_varugrupp(row):
     """Transform varugrupp rows."""
 
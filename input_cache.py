@@ -0,0 +1,90 @@
+import hashlib
+import os
+import threading
+
+import pandas as pd
+
+
+# The frames are pickled, which keeps the dtypes and None and NaN in object
+# columns exactly as parsed. Both end up in the quoted output, and Parquet
+# has not been checked to round trip them
+CACHE_FORMAT = "pickle"
+
+
+class InputCache:
+    """
+    On-disk cache of parsed export input frames.
+
+    A frame is stored under a hash of the content of its CSV file, the schema
+    and the CSV engine it was read with, so a file that is dropped in again, or copied
+    under another name, is read from the cache instead of being parsed. When
+    the cache grows past max_bytes the least recently used frames are removed.
+    """
+
+    def __init__(self, folder, max_bytes=2 * 1024**3):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, file_path, schema, engine="c"):
+        # The engines don't always give the same frame, see compare_csv_engines
+        digest = hashlib.sha256()
+        digest.update(
+            repr((CACHE_FORMAT, pd.__version__, engine, schema.columns, schema.dtype)).encode()
+        )
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, f"{key}.{CACHE_FORMAT}")
+
+    def load(self, key):
+        """The cached frame for key, or None if there is none."""
+        cache_path = self.path(key)
+        try:
+            data = pd.read_pickle(cache_path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: Could not read cached input {cache_path}: {e}")
+            return None
+
+        # Marks the frame as recently used for the eviction
+        os.utime(cache_path)
+        return data
+
+    def store(self, key, data):
+        cache_path = self.path(key)
+        temporary_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        try:
+            data.to_pickle(temporary_path)
+            os.replace(temporary_path, cache_path)
+        except Exception as e:
+            print(f"Warning: Could not cache input in {cache_path}: {e}")
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used frames until the cache fits in max_bytes."""
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.folder):
+                if entry.is_file() and entry.name.endswith(f".{CACHE_FORMAT}"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, cache_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(cache_path)
+                except OSError:
+                    continue
+                total -= size
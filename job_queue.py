@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from metrics import write_run
+
+
+class JobQueue:
+    """
+    A bounded queue of jobs served by a pool of worker threads, so a watchdog
+    callback only hands a job over and never waits for it to run.
+
+    A job is submitted with a key, e.g. its file paths, and a job whose key is
+    already queued or running is not submitted again. The queue depth and the
+    wait and run time of the latest jobs are in stats(), and with a
+    metrics_file every finished job is appended to it as one JSON line.
+
+    A job that didn't fit in a full queue is not kept. on_slot_free is called
+    once a worker takes the next job off the queue after that, so the caller
+    can submit it again.
+    """
+
+    def __init__(self, name, workers=1, max_size=10, metrics_file=None, on_slot_free=None):
+        self.name = name
+        self.metrics_file = metrics_file
+        self.on_slot_free = on_slot_free
+        self.turned_away = False
+        self.jobs = queue.Queue(maxsize=max_size)
+        self.lock = threading.Lock()
+        self.keys = set()
+        self.running = 0
+        self.done = 0
+        self.failed = 0
+        # (seconds waiting in the queue, seconds running) of the latest jobs
+        self.latencies = deque(maxlen=100)
+
+        self.workers = [
+            threading.Thread(target=self.work, name=f"{name}-{number}", daemon=True)
+            for number in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, key, action, *args):
+        """
+        Queues action(*args). Returns False if a job with key is already
+        queued or running, or if the queue is full.
+        """
+        with self.lock:
+            if key in self.keys:
+                return False
+            try:
+                self.jobs.put_nowait((key, action, args, time.perf_counter()))
+            except queue.Full:
+                print(f"Warning: The {self.name} queue is full, {key} is left for later.")
+                self.turned_away = True
+                return False
+            self.keys.add(key)
+        return True
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+
+            key, action, args, submitted = job
+            with self.lock:
+                self.running += 1
+                slot_freed = self.turned_away
+                self.turned_away = False
+            if slot_freed and self.on_slot_free is not None:
+                self.on_slot_free()
+            started = time.perf_counter()
+            failed = False
+            try:
+                action(*args)
+            except Exception:
+                failed = True
+                print(f"An error occurred in the {self.name} queue:\n{traceback.format_exc()}")
+            finished = time.perf_counter()
+
+            with self.lock:
+                self.running -= 1
+                self.keys.discard(key)
+                if failed:
+                    self.failed += 1
+                else:
+                    self.done += 1
+                self.latencies.append((started - submitted, finished - started))
+                depth = self.jobs.qsize()
+            self.jobs.task_done()
+
+            print(
+                f"{self.name.capitalize()} job finished in {finished - submitted:.2f}s "
+                f"({started - submitted:.2f}s queued), {depth} waiting"
+            )
+            if self.metrics_file is not None:
+                write_run(
+                    self.metrics_file,
+                    {
+                        "action": f"{self.name}_job",
+                        "finished": datetime.now().isoformat(timespec="seconds"),
+                        "wait_seconds": round(started - submitted, 6),
+                        "run_seconds": round(finished - started, 6),
+                        "failed": failed,
+                        "queue_depth": depth,
+                    },
+                )
+
+    def depth(self):
+        """Jobs waiting in the queue, not counting those running."""
+        return self.jobs.qsize()
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            stats = {
+                "name": self.name,
+                "queued": self.jobs.qsize(),
+                "running": self.running,
+                "done": self.done,
+                "failed": self.failed,
+            }
+        if latencies:
+            stats["mean_wait_seconds"] = sum(wait for wait, _ in latencies) / len(latencies)
+            stats["mean_run_seconds"] = sum(run for _, run in latencies) / len(latencies)
+            stats["max_latency_seconds"] = max(wait + run for wait, run in latencies)
+        return stats
+
+    def stop(self, wait=True):
+        """Lets the queued jobs finish and stops the workers."""
+        for _ in self.workers:
+            self.jobs.put(None)
+        if wait:
+            for worker in self.workers:
+                worker.join()
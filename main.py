@@ -4,17 +4,26 @@ import time
 import pytz
 import traceback
 import re
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
 from export import export_action
 from import_ import import_action
+from job_queue import JobQueue
+from folder_index import FolderIndex
+from file_readiness import FileReadiness
+
+# Export files that are used when they are there but not waited for
+OPTIONAL_EXPORT_KEYWORDS = ["Presentkort_sold", "Presentkort_used", "Följesedlar"]
 
 def move_files_to_old_folder(file_paths, folder_to_watch):
     old_folder_path = os.path.join("C:/winbag_export", "Old Files")
     if not os.path.exists(old_folder_path):
-        os.makedirs(old_folder_path)
+        # Another job may create it at the same time
+        os.makedirs(old_folder_path, exist_ok=True)
         print(f"Created 'Old Files' folder at {old_folder_path}")
 
     stockholm_tz = pytz.timezone("Europe/Stockholm")
@@ -35,19 +44,28 @@ def extract_date_from_filename(filename):
         return match.group(1)
     return None
 
-def custom_export_action(file_paths, folder_to_watch):
+def custom_export_action(file_paths, folder_to_watch, export_options=None, readiness=None):
     try:
+        # Waits until the files are completely written, see FileReadiness
+        if readiness is not None and not readiness.wait_until_ready(file_paths):
+            print(f"Skipping export, the files are gone or still being written: {file_paths}")
+            return
         print("Performing export...")
-        export_action(file_paths)
+        export_action(file_paths, **(export_options or {}))
         move_files_to_old_folder(file_paths, folder_to_watch)
     except Exception as e:
         tb = traceback.format_exc()
         print(f"An error occurred during export_action:\n{tb}")
 
-def custom_import_action(file_path, folder_to_watch):
+def custom_import_action(
+    file_path, folder_to_watch, metrics_file=None, trace_memory=False, readiness=None
+):
     try:
+        if readiness is not None and not readiness.wait_until_ready(file_path):
+            print(f"Skipping import, the file is gone or still being written: {file_path}")
+            return
         print("Performing import...")
-        import_action(file_path)
+        import_action(file_path, metrics_file, trace_memory)
         move_files_to_old_folder(file_path, folder_to_watch)
     except Exception as e:
         tb = traceback.format_exc()
@@ -55,26 +73,63 @@ def custom_import_action(file_path, folder_to_watch):
 
 class FileRenameHandler(FileSystemEventHandler):
     def __init__(
-        self, export_folder, import_folder, export_required_keywords, import_required_keyword
+        self,
+        export_folder,
+        import_folder,
+        export_required_keywords,
+        import_required_keyword,
+        export_options=None,
+        quiet_seconds=1.0,
+        stable_seconds=0.5,
+        import_workers=1,
+        export_workers=1,
+        queue_size=10,
     ):
         self.export_folder = export_folder
         self.import_folder = import_folder
         self.mandatory_keywords = [
             kw
             for kw in export_required_keywords
-            if kw not in ["Presentkort_sold", "Presentkort_used", "Följesedlar"]
+            if kw not in OPTIONAL_EXPORT_KEYWORDS
         ]
-        self.optional_keywords = ["Presentkort_sold", "Presentkort_used", "Följesedlar"]
+        self.optional_keywords = OPTIONAL_EXPORT_KEYWORDS
         self.import_required_keyword = import_required_keyword
+        self.export_options = export_options or {}
+
+        # The candidate files of both folders, listed once here and then kept
+        # up to date from the events, see reconcile
+        self.export_index = FolderIndex(
+            export_folder, self.mandatory_keywords + self.optional_keywords
+        )
+        self.import_index = FolderIndex(import_folder, [import_required_keyword])
+
+        # A burst of created files is processed once, quiet_seconds after the
+        # last of them, and never by two threads at the same time
+        self.quiet_seconds = quiet_seconds
+        self._lock = threading.Lock()
+        self._timer = None
+        self._running = False
+        self._pending = False
+
+        # The jobs wait for their files to be completely written
+        self.readiness = FileReadiness(stable_seconds)
+
+        # Imports and exports run in their own worker threads, off the
+        # watchdog thread, and an import never waits for an export
+        metrics_file = self.export_options.get("metrics_file")
+        # A job that didn't fit in a full queue is submitted again by the next
+        # processing run, scheduled as soon as the queue has room
+        self.import_jobs = JobQueue(
+            "import", import_workers, queue_size, metrics_file, self._schedule_processing
+        )
+        self.export_jobs = JobQueue(
+            "export", export_workers, queue_size, metrics_file, self._schedule_processing
+        )
         print(f"Initialized FileRenameHandler instance: {id(self)}")
 
     def _find_files_with_keywords(self, folder, keywords):
-        current_files = os.listdir(folder)
-        matching_files = []
-        for file in current_files:
-            if any(keyword in file for keyword in keywords):
-                matching_files.append(os.path.join(folder, file))
-        return matching_files
+        index = self.export_index if folder == self.export_folder else self.import_index
+        return index.find(keywords)
 
     def _all_mandatory_files_present(self):
         matching_files = self._find_files_with_keywords(self.export_folder, self.mandatory_keywords)
@@ -85,19 +140,26 @@ class FileRenameHandler(FileSystemEventHandler):
         return self._find_files_with_keywords(self.export_folder, self.optional_keywords)
 
     def _is_import_file_present(self):
-        return any(
-            self.import_required_keyword in file
-            for file in os.listdir(self.import_folder)
-        )
+        return bool(self._find_files_with_keywords(self.import_folder, [self.import_required_keyword]))
 
     def _process_files(self):
-        if self._is_import_file_present():
-            import_files = self._find_files_with_keywords(self.import_folder, [self.import_required_keyword])
-            for file_path in import_files:
-                print(f"Detected PCS file: {file_path}. Starting import action.")
-                custom_import_action([file_path], self.import_folder)
+        import_files = self._find_files_with_keywords(
+            self.import_folder, [self.import_required_keyword]
+        )
 
-        elif self._all_mandatory_files_present():
+        for file_path in import_files:
+            if self.import_jobs.submit(
+                file_path,
+                custom_import_action,
+                [file_path],
+                self.import_folder,
+                self.export_options.get("metrics_file"),
+                self.export_options.get("trace_memory", False),
+                self.readiness,
+            ):
+                print(f"Detected PCS file: {file_path}. Queued import action.")
+
+        if self._all_mandatory_files_present():
             mandatory_files = self._find_files_with_keywords(self.export_folder, self.mandatory_keywords)
             optional_files = self._get_optional_files()
             file_paths = mandatory_files + optional_files
@@ -108,38 +170,299 @@ class FileRenameHandler(FileSystemEventHandler):
                     sales_date = extract_date_from_filename(os.path.basename(file_path))
                     break
 
-            if optional_files:
-                print(f"Including optional files: {optional_files}")
-
-            print("Detected all required export files. Starting export action.")
-            custom_export_action(file_paths, self.export_folder)
-        else:
+            if self.export_jobs.submit(
+                tuple(sorted(file_paths)),
+                custom_export_action,
+                file_paths,
+                self.export_folder,
+                self.export_options,
+                self.readiness,
+            ):
+                if optional_files:
+                    print(f"Including optional files: {optional_files}")
+                print("Detected all required export files. Queued export action.")
+        elif not import_files:
             print("Waiting for PCS or all required export files...")
 
+    def _schedule_processing(self):
+        """Processes the files once no file has been created for quiet_seconds."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.quiet_seconds, self._process_files_once)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _process_files_once(self):
+        """
+        Runs _process_files unless a run is already going on. Files created
+        during a run are processed by one more run right after it.
+        """
+        with self._lock:
+            self._timer = None
+            if self._running:
+                self._pending = True
+                return
+            self._running = True
+
+        while True:
+            try:
+                self._process_files()
+            except Exception:
+                print(f"An error occurred while processing files:\n{traceback.format_exc()}")
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                self._pending = False
+
+    def job_stats(self):
+        """Queue depth, running and finished jobs and latencies of both lanes."""
+        return [self.import_jobs.stats(), self.export_jobs.stats()]
+
+    def stop(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        # The jobs already queued are finished first
+        self.import_jobs.stop()
+        self.export_jobs.stop()
+
+    def reconcile(self):
+        """
+        Rescans both folders in case an event was missed, e.g. on a network
+        drive, and processes the files if the index had missed a change.
+        """
+        try:
+            changed = self.export_index.scan()
+            changed = self.import_index.scan() or changed
+        except OSError as e:
+            print(f"Warning: Could not rescan the folders: {e}")
+            return
+        if changed:
+            print("Found files that no event reported.")
+            self._schedule_processing()
+
+    def process_existing_files(self):
+        """
+        Processes the files already in the folders, e.g. those that came in
+        before the observer was started.
+        """
+        if self._is_import_file_present() or self._all_mandatory_files_present():
+            self._schedule_processing()
+
+    def _is_candidate(self, file_path):
+        return any(
+            index.name_in_folder(file_path) is not None
+            and index.matches(os.path.basename(file_path))
+            for index in (self.export_index, self.import_index)
+        )
+
+    def _add_to_index(self, file_path):
+        added = self.export_index.add(file_path)
+        return self.import_index.add(file_path) or added
+
     def on_created(self, event):
         if not event.is_directory:
             #print(f"File added: {event.src_path}")
-            self._process_files()
+            self._add_to_index(event.src_path)
+            self._schedule_processing()
+
+    def on_modified(self, event):
+        if not event.is_directory and self._is_candidate(event.src_path):
+            self.readiness.modified(event.src_path)
+
+    def on_closed(self, event):
+        # Only reported on some platforms, e.g. by inotify on Linux
+        if not event.is_directory and self._is_candidate(event.src_path):
+            self.readiness.closed_after_writing(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.export_index.remove(event.src_path)
+            self.import_index.remove(event.src_path)
+            self.readiness.forget(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.export_index.remove(event.src_path)
+            self.import_index.remove(event.src_path)
+            self.readiness.forget(event.src_path)
+            if self._add_to_index(event.dest_path):
+                self._schedule_processing()
+
+def find_backlog_export_sets(export_folder, export_required_keywords):
+    """
+    The complete export sets in export_folder as {sales date: file paths},
+    oldest first. A file belongs to the set whose extract_date_from_filename
+    date its name contains. Files without a date are only placed when there
+    is a single set, otherwise they are left for the live monitoring.
+    """
+    mandatory_keywords = [
+        kw for kw in export_required_keywords if kw not in OPTIONAL_EXPORT_KEYWORDS
+    ]
+    keywords = mandatory_keywords + OPTIONAL_EXPORT_KEYWORDS
+    file_names = [
+        file_name
+        for file_name in sorted(os.listdir(export_folder))
+        if any(keyword in file_name for keyword in keywords)
+    ]
+
+    sales_dates = sorted(
+        {extract_date_from_filename(file_name) for file_name in file_names} - {None}
+    )
+    export_sets = {
+        sales_date: [file_name for file_name in file_names if sales_date in file_name]
+        for sales_date in sales_dates
+    }
+    undated = [
+        file_name
+        for file_name in file_names
+        if not any(sales_date in file_name for sales_date in sales_dates)
+    ]
+    if undated and len(sales_dates) == 1:
+        export_sets[sales_dates[0]].extend(undated)
+    elif undated:
+        print(f"Warning: Can't tell which sales date these files belong to: {undated}")
+
+    complete_sets = {}
+    for sales_date, set_names in export_sets.items():
+        if all(any(kw in file_name for file_name in set_names) for kw in mandatory_keywords):
+            complete_sets[sales_date] = [
+                os.path.join(export_folder, file_name) for file_name in set_names
+            ]
+        else:
+            print(f"Export files of {sales_date} are incomplete, waiting for the rest.")
+    return complete_sets
+
+def drain_backlog(
+    export_folder,
+    import_folder,
+    export_required_keywords,
+    import_required_keyword,
+    export_options=None,
+    workers=4,
+    stable_seconds=0.5,
+):
+    """
+    Exports and imports the files that were left in the folders while the
+    service was down, workers jobs at a time, and returns when all are done.
+
+    The PCS files are imported one after another, oldest first, so the newest
+    articles are imported last. Different sales days are exported in parallel.
+    The sets of one day write the same store files, so they are exported one
+    after another, oldest first, so the newest ends up on disk. With a
+    checkpoint in export_options all sets are exported one after another,
+    since they share its state.
+    """
+    export_options = export_options or {}
+    export_sets = find_backlog_export_sets(export_folder, export_required_keywords)
+    import_files = sorted(
+        (
+            os.path.join(import_folder, file_name)
+            for file_name in os.listdir(import_folder)
+            if import_required_keyword in file_name
+        ),
+        key=lambda file_path: (os.path.getmtime(file_path), file_path),
+    )
+    if not export_sets and not import_files:
+        return
+
+    print(
+        f"Processing {len(export_sets)} export sets and {len(import_files)} PCS files "
+        "that arrived while the service was down."
+    )
+    export_days = {}
+    for sales_date, file_paths in export_sets.items():
+        export_days.setdefault(sales_date.split("_")[0], []).append((sales_date, file_paths))
+    if export_options.get("checkpoint") is not None:
+        export_days = {"all": [export_set for day in export_days.values() for export_set in day]}
+
+    readiness = FileReadiness(stable_seconds)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if import_files:
+            executor.submit(
+                import_backlog_files, import_files, import_folder, export_options, readiness
+            )
+        for day_sets in export_days.values():
+            executor.submit(
+                export_backlog_sets, day_sets, export_folder, export_options, readiness
+            )
+    print("Done with the files from before startup.")
+
+def import_backlog_files(import_files, import_folder, export_options, readiness):
+    """Imports the PCS files of import_files one after another."""
+    for file_path in import_files:
+        print(f"Importing {file_path}")
+        custom_import_action(
+            [file_path],
+            import_folder,
+            export_options.get("metrics_file"),
+            export_options.get("trace_memory", False),
+            readiness,
+        )
+
+def export_backlog_sets(export_sets, export_folder, export_options, readiness):
+    """Exports the (sales date, file paths) of export_sets one after another."""
+    for sales_date, file_paths in export_sets:
+        print(f"Exporting the files of {sales_date}")
+        custom_export_action(file_paths, export_folder, export_options, readiness)
+
+def monitor_folders(
+    export_folder,
+    import_folder,
+    export_required_keywords,
+    import_required_keyword,
+    export_options=None,
+    quiet_seconds=1.0,
+    stable_seconds=0.5,
+    import_workers=1,
+    export_workers=1,
+    reconcile_seconds=60,
+    backlog_workers=4,
+):
+    drain_backlog(
+        export_folder,
+        import_folder,
+        export_required_keywords,
+        import_required_keyword,
+        export_options,
+        backlog_workers,
+        stable_seconds,
+    )
 
-def monitor_folders(export_folder, import_folder, export_required_keywords, import_required_keyword):
     event_handler = FileRenameHandler(
         export_folder=export_folder,
         import_folder=import_folder,
         export_required_keywords=export_required_keywords,
         import_required_keyword=import_required_keyword,
+        export_options=export_options,
+        quiet_seconds=quiet_seconds,
+        stable_seconds=stable_seconds,
+        import_workers=import_workers,
+        export_workers=export_workers,
     )
     observer = Observer()
     observer.schedule(event_handler, export_folder, recursive=False)
     observer.schedule(event_handler, import_folder, recursive=False)
     observer.start()
+    # Files that came in while the backlog was processed
+    event_handler.process_existing_files()
     print(f"Monitoring export folder: {export_folder}")
     print(f"Monitoring import folder: {import_folder}")
 
     try:
+        last_reconcile = time.monotonic()
         while True:
             time.sleep(5)
+            if time.monotonic() - last_reconcile >= reconcile_seconds:
+                event_handler.reconcile()
+                last_reconcile = time.monotonic()
     except KeyboardInterrupt:
         observer.stop()
+        print("Stopping, finishing the queued jobs...")
+        event_handler.stop()
         print("Stopped monitoring.")
     observer.join()
 
@@ -149,13 +472,80 @@ if __name__ == "__main__":
     export_required_keywords = ["Försäljning", "Betalsätt", "Följesedlar", "Moms"]
     import_required_keyword = "PCS.ADM"
 
+    # Passed on to export_action, e.g. {"workers": 4} builds the store files
+    # in 4 processes, {"chunksize": 100000} streams Försäljning in chunks and
+    # {"split_days": True} writes one file per store and day. An InputCache in
+    # "input_cache" keeps the parsed input files for reruns on the same files,
+    # e.g. InputCache("C:/winbag_export/cache"). {"csv_engine": "pyarrow"} parses
+    # the files with pyarrow when it is installed. With a "metrics_file", e.g.
+    # "C:/winbag_export/metrics.jsonl", every export and import appends the
+    # time, rows, records and bytes of each of its stages to it, and with
+    # {"trace_memory": True} their peak memory, which slows the run down. A
+    # ReceiptCheckpoint in "checkpoint", e.g.
+    # ReceiptCheckpoint("C:/winbag_export/checkpoint.sqlite"), exports the files
+    # dropped in during the day as snapshots, only their new receipts processed
+    export_options = {
+        "workers": None,
+        "chunksize": None,
+        "split_days": False,
+        "input_cache": None,
+        "csv_engine": "c",
+        "metrics_file": None,
+        "trace_memory": False,
+        "checkpoint": None,
+    }
+
+    # Seconds without a new file before the files that arrived together are
+    # processed, in one run
+    quiet_seconds = 1.0
+
+    # Seconds a file's size and modification time must stay the same before
+    # it is taken to be completely written, when no close event says so
+    stable_seconds = 0.5
+
+    # Worker threads of the import and the export queue. Exports of the same
+    # folder are kept one at a time by default
+    import_workers = 1
+    export_workers = 1
+
+    # Seconds between the rescans that catch files no event reported
+    reconcile_seconds = 60
+
+    # Jobs run at the same time for the files left in the folders while the
+    # service was down, before the monitoring starts
+    backlog_workers = 4
+
     if os.path.exists(export_folder) and os.path.exists(import_folder):
-        monitor_folders(export_folder, import_folder, export_required_keywords, import_required_keyword)
+        monitor_folders(
+            export_folder,
+            import_folder,
+            export_required_keywords,
+            import_required_keyword,
+            export_options,
+            quiet_seconds,
+            stable_seconds,
+            import_workers,
+            export_workers,
+            reconcile_seconds,
+            backlog_workers,
+        )
     else:
         print("One or both specified folders do not exist. Creating missing folders...")
         try:
             os.makedirs(export_folder, exist_ok=True)
             os.makedirs(import_folder, exist_ok=True)
-            monitor_folders(export_folder, import_folder, export_required_keywords, import_required_keyword)
+            monitor_folders(
+                export_folder,
+                import_folder,
+                export_required_keywords,
+                import_required_keyword,
+                export_options,
+                quiet_seconds,
+                stable_seconds,
+                import_workers,
+                export_workers,
+                reconcile_seconds,
+                backlog_workers,
+            )
         except Exception as e:
             print(f"Failed to create folders. Error: {e}")
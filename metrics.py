@@ -0,0 +1,237 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# The runs being recorded, per thread, so an import and an export running at
+# the same time don't mix their stages
+_state = threading.local()
+
+# tracemalloc is shared by the whole process, it is traced while any run is
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+
+
+class Stage:
+    """
+    Wall time, rows in, records and bytes out and peak traced memory of one
+    stage. peak_memory stays None when the run doesn't trace memory.
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.records_out = 0
+        self.bytes_out = 0
+        self.calls = None
+        self.seconds = 0.0
+        self.peak_memory = None
+
+    def as_dict(self):
+        stage = {
+            "name": self.name,
+            "seconds": round(self.seconds, 6),
+            "rows_in": self.rows_in,
+            "records_out": self.records_out,
+            "bytes_out": self.bytes_out,
+            "peak_memory": self.peak_memory,
+        }
+        if self.calls is not None:
+            stage["calls"] = self.calls
+        return stage
+
+
+class Run:
+    def __init__(self, action, file_paths):
+        self.action = action
+        self.file_paths = list(file_paths or [])
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.stages = []
+        self.open_stages = []
+        self.totals = {}
+
+    def as_dict(self, seconds, peak_memory):
+        return {
+            "action": self.action,
+            "started": self.started,
+            "files": [os.path.basename(file_path) for file_path in self.file_paths],
+            "seconds": round(seconds, 6),
+            "peak_memory": peak_memory,
+            "stages": [stage.as_dict() for stage in self.stages + list(self.totals.values())],
+        }
+
+
+def current_run():
+    runs = getattr(_state, "runs", None)
+    return runs[-1] if runs else None
+
+
+def start_tracing():
+    global _tracing_runs
+    with _tracing_lock:
+        if _tracing_runs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_runs = 1
+        elif _tracing_runs > 0:
+            _tracing_runs += 1
+
+
+def stop_tracing():
+    global _tracing_runs
+    with _tracing_lock:
+        if _tracing_runs > 0:
+            _tracing_runs -= 1
+            if _tracing_runs == 0:
+                tracemalloc.stop()
+
+
+def traced_peak(peak=None):
+    """The larger of peak and the traced peak, None when memory isn't traced."""
+    if not tracemalloc.is_tracing():
+        return peak
+    return max(peak or 0, tracemalloc.get_traced_memory()[1])
+
+
+@contextmanager
+def record_run(action, metrics_file, file_paths=None, trace_memory=False):
+    """
+    Records the stages run inside it and appends them to metrics_file as one
+    JSON line. Does nothing when metrics_file is None.
+
+    With trace_memory the peak memory of each stage is measured with
+    tracemalloc. It is the peak of everything Python allocated in the process
+    during the stage, and tracing makes the run several times slower, so the
+    times of such a run are not comparable to those of an untraced one.
+    """
+    if metrics_file is None:
+        yield None
+        return
+
+    run = Run(action, file_paths)
+    if not hasattr(_state, "runs"):
+        _state.runs = []
+    _state.runs.append(run)
+    if trace_memory:
+        start_tracing()
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield run
+    finally:
+        seconds = time.perf_counter() - start
+        peak_memory = traced_peak()
+        for measured in run.stages:
+            if measured.peak_memory is not None:
+                peak_memory = max(peak_memory or 0, measured.peak_memory)
+        if trace_memory:
+            stop_tracing()
+        _state.runs.pop()
+        write_run(metrics_file, run.as_dict(seconds, peak_memory))
+
+
+def write_run(metrics_file, record):
+    folder = os.path.dirname(metrics_file)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    try:
+        with open(metrics_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Warning: Could not write metrics to {metrics_file}: {e}")
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Measures the code inside it as one stage of the current run. Records and
+    bytes written inside the stage are counted by count_output, the records
+    by the stage that builds them and the bytes by the one that writes them to
+    disk, so each is counted once per run.
+    """
+    run = current_run()
+    if run is None:
+        yield None
+        return
+
+    measured = Stage(name, rows_in)
+    if run.open_stages:
+        # The peak of the enclosing stage so far, before it is reset for this one
+        outer = run.open_stages[-1]
+        outer.peak_memory = traced_peak(outer.peak_memory)
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+    run.stages.append(measured)
+    run.open_stages.append(measured)
+    start = time.perf_counter()
+    try:
+        yield measured
+    finally:
+        measured.seconds = time.perf_counter() - start
+        measured.peak_memory = traced_peak(measured.peak_memory)
+        run.open_stages.pop()
+        if run.open_stages and measured.peak_memory is not None:
+            outer = run.open_stages[-1]
+            outer.peak_memory = max(outer.peak_memory or 0, measured.peak_memory)
+
+
+def is_recording():
+    run = current_run()
+    return run is not None and bool(run.open_stages)
+
+
+def row_count(data):
+    """The rows of an input frame, 0 for an input that was not given or is streamed."""
+    return len(data) if hasattr(data, "__len__") else 0
+
+
+def count_input(rows):
+    """Adds rows to the rows in of the innermost stage."""
+    run = current_run()
+    if run is not None and run.open_stages:
+        measured = run.open_stages[-1]
+        measured.rows_in = (measured.rows_in or 0) + rows
+
+
+def count_output(records, size=0):
+    """Adds records and size bytes, as written to disk, to the output of the innermost stage."""
+    run = current_run()
+    if run is not None and run.open_stages:
+        measured = run.open_stages[-1]
+        measured.records_out += records
+        measured.bytes_out += size
+
+
+def timed(func):
+    """
+    Adds the time spent in func to a stage named after it, summed over all its
+    calls in a run, for functions called once per row like the import transforms.
+    Every call counts as one record out.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = current_run()
+        if run is None:
+            return func(*args, **kwargs)
+
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        total = run.totals.get(func.__name__)
+        if total is None:
+            total = run.totals[func.__name__] = Stage(func.__name__, 0)
+            total.calls = 0
+        total.seconds += seconds
+        total.calls += 1
+        total.rows_in += 1
+        total.records_out += 1
+        return result
+
+    return wrapper
@@ -0,0 +1,109 @@
+import os
+import shutil
+
+import numpy as np
+
+from formatting import map_unique
+from metrics import count_output, is_recording
+
+
+# Every value of a HiOPOS record is written as f'"{value}"', which is what
+# format(value) gives inside the quotes
+
+def encode_rows(rows):
+    """Quotes every value of each row, returning newline terminated lines."""
+    return ['"' + '","'.join(map(format, row)) + '"\n' for row in rows]
+
+
+def encode_columns(columns):
+    """
+    Same lines as encode_rows for rows given column by column. A column is
+    either one value for every row, like the record type, or an array.
+
+    Each array is formatted once per distinct value and the lines are joined
+    as whole arrays instead of value by value.
+    """
+    length = max((len(column) for column in columns if not isinstance(column, str)), default=0)
+    if length == 0:
+        return []
+
+    lines = np.full(length, '"', dtype=object)
+    for position, column in enumerate(columns):
+        if position > 0:
+            lines = lines + '","'
+        if isinstance(column, str):
+            lines = lines + column
+        else:
+            lines = lines + map_unique(column, format)
+    return (lines + '"\n').tolist()
+
+
+class SpilledLines:
+    """
+    Quoted lines kept in a file at path instead of in memory until the sink
+    they are written to is flushed. The file is written in text mode with the
+    default encoding like the store files, so it can be copied into them as is.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def extend(self, lines):
+        with open(self.path, "a") as f:
+            f.writelines(lines)
+        self.count += len(lines)
+
+    def copy_to(self, f):
+        if self.count:
+            with open(self.path) as spilled:
+                shutil.copyfileobj(spilled, f, 1 << 20)
+
+
+class OutputSink:
+    """
+    Collects the records of every store file for a whole export in memory and
+    writes each file once, with a single write, when flushed.
+
+    Files are opened in text mode with the default encoding, the same way the
+    data_XX builders open them, so the bytes on disk are unchanged.
+    """
+
+    def __init__(self, file_map):
+        self.buffers = {target_file: [] for target_file in file_map.values()}
+
+    def write_rows(self, file_data):
+        """Adds the rows for each target file, quoting every value."""
+        for target_file, rows in file_data.items():
+            self.write_lines(target_file, encode_rows(rows))
+
+    def write_lines(self, target_file, lines):
+        """
+        Adds lines that are already quoted and newline terminated, or the
+        SpilledLines they were kept in, which are copied in when flushed.
+        """
+        if isinstance(lines, SpilledLines):
+            self.buffers.setdefault(target_file, []).append(lines)
+            if is_recording():
+                count_output(lines.count)
+            return
+        self.buffers.setdefault(target_file, []).extend(lines)
+        if is_recording():
+            count_output(len(lines))
+
+    def flush(self):
+        for target_file, parts in self.buffers.items():
+            with open(target_file, "w") as f:
+                lines = []
+                for part in parts:
+                    if isinstance(part, SpilledLines):
+                        f.write("".join(lines))
+                        lines = []
+                        part.copy_to(f)
+                    else:
+                        lines.append(part)
+                f.write("".join(lines))
+            # The lines were counted when they were buffered, only the bytes here
+            if is_recording():
+                count_output(0, os.path.getsize(target_file))
+        self.buffers = {}
@@ -0,0 +1,225 @@
+import os
+import pickle
+import sqlite3
+import threading
+
+import pandas as pd
+
+from export_engine import (
+    SalesRecordAccumulator,
+    PaymentRecordAccumulator,
+    normalize_nummer,
+)
+from formatting import map_unique
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS days (
+    export_date TEXT PRIMARY KEY,
+    full INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS receipts (
+    export_date TEXT NOT NULL,
+    source TEXT NOT NULL,
+    receipt TEXT NOT NULL,
+    PRIMARY KEY (export_date, source, receipt)
+);
+CREATE TABLE IF NOT EXISTS sales_stores (
+    export_date TEXT NOT NULL,
+    butikskod TEXT NOT NULL,
+    header BLOB NOT NULL,
+    sums_08 BLOB NOT NULL,
+    sums_10 BLOB NOT NULL,
+    PRIMARY KEY (export_date, butikskod)
+);
+CREATE TABLE IF NOT EXISTS lines_06 (
+    export_date TEXT NOT NULL,
+    butikskod TEXT NOT NULL,
+    line TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lines_06_day ON lines_06 (export_date);
+CREATE TABLE IF NOT EXISTS payment_stores (
+    export_date TEXT NOT NULL,
+    butikskod TEXT NOT NULL,
+    sums_04 BLOB NOT NULL,
+    PRIMARY KEY (export_date, butikskod)
+);
+CREATE TABLE IF NOT EXISTS payment_keys (
+    export_date TEXT NOT NULL,
+    payment BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payment_keys_day ON payment_keys (export_date);
+"""
+
+# Separates the fields of a receipt key, it is not in any WinBag value
+KEY_SEPARATOR = "\x1f"
+
+
+def receipt_keys(data, sales_date):
+    """
+    The receipt of each row as one string of its ButikskodWinbag, Serie,
+    Nummer and Dok.datum. A file without Dok.datum is taken to be all of
+    sales_date.
+    """
+    if "Dok.datum" in data.columns:
+        datums = map_unique(data["Dok.datum"], str)
+    else:
+        datums = str(sales_date)
+
+    keys = map_unique(data["ButikskodWinbag"], str) + KEY_SEPARATOR
+    keys = keys + map_unique(data["Serie"], str) + KEY_SEPARATOR
+    keys = keys + map_unique(data["Nummer"], normalize_nummer) + KEY_SEPARATOR
+    return keys + datums
+
+
+class ReceiptCheckpoint:
+    """
+    SQLite store of what an incremental export has already exported, per
+    export day: the receipts of Försäljning and Betalsätt, keyed by
+    (ButikskodWinbag, Serie, Nummer, Dok.datum), with the running 04, 08 and
+    10 sums and the 06 lines they add up to.
+
+    Each snapshot of the day's files then only has its new receipts turned
+    into records. A day whose amounts need the Decimal parsing of the data_XX
+    builders is marked as full and exported as a whole from then on.
+
+    lock only keeps the statements of two threads apart. An export holds the
+    day_lock of its day from load to save, so two snapshots of one day are
+    never exported at the same time through the same ReceiptCheckpoint.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.day_locks = {}
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def day_lock(self, export_date):
+        """The lock an incremental export of export_date holds while it runs."""
+        with self.lock:
+            return self.day_locks.setdefault(export_date, threading.Lock())
+
+    def new_rows(self, export_date, source, keys):
+        """Boolean mask of the rows whose receipt key in keys is not in the checkpoint."""
+        with self.lock:
+            known = [
+                receipt
+                for (receipt,) in self.connection.execute(
+                    "SELECT receipt FROM receipts WHERE export_date = ? AND source = ?",
+                    (export_date, source),
+                )
+            ]
+        return ~pd.Index(keys).isin(known)
+
+    def load(self, export_date):
+        """
+        The SalesRecordAccumulator and PaymentRecordAccumulator of export_date,
+        empty for a new day, or None for a day that is exported as a whole.
+        """
+        with self.lock:
+            day = self.connection.execute(
+                "SELECT full FROM days WHERE export_date = ?", (export_date,)
+            ).fetchone()
+            if day is not None and day[0]:
+                return None
+
+            sales = SalesRecordAccumulator()
+            for butikskod, header, sums_08, sums_10 in self.connection.execute(
+                "SELECT butikskod, header, sums_08, sums_10 FROM sales_stores "
+                "WHERE export_date = ? ORDER BY rowid",
+                (export_date,),
+            ):
+                sales.headers[butikskod] = pickle.loads(header)
+                sales.sums_08[butikskod] = pickle.loads(sums_08)
+                sales.sums_10[butikskod] = pickle.loads(sums_10)
+                sales.lines_06[butikskod] = []
+            for butikskod, line in self.connection.execute(
+                "SELECT butikskod, line FROM lines_06 WHERE export_date = ? ORDER BY rowid",
+                (export_date,),
+            ):
+                sales.lines_06[butikskod].append(line)
+
+            payments = PaymentRecordAccumulator(counted=set())
+            for butikskod, sums_04 in self.connection.execute(
+                "SELECT butikskod, sums_04 FROM payment_stores "
+                "WHERE export_date = ? ORDER BY rowid",
+                (export_date,),
+            ):
+                payments.sums[butikskod] = pickle.loads(sums_04)
+            for (payment,) in self.connection.execute(
+                "SELECT payment FROM payment_keys WHERE export_date = ?", (export_date,)
+            ):
+                payments.counted.add(pickle.loads(payment))
+            payments.saved = set(payments.counted)
+
+        return sales, payments
+
+    def save(self, export_date, receipts, sales, new_lines_06, payments):
+        """
+        Adds the new receipts, {source: keys}, and the new 06 lines per store
+        of export_date and replaces its sums with those of sales and payments,
+        all in one transaction.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO days (export_date) VALUES (?)", (export_date,)
+            )
+            for source, keys in receipts.items():
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO receipts VALUES (?, ?, ?)",
+                    ((export_date, source, key) for key in keys),
+                )
+
+            for butikskod, header in sales.headers.items():
+                self.connection.execute(
+                    "INSERT INTO sales_stores VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (export_date, butikskod) DO UPDATE SET "
+                    "header = excluded.header, sums_08 = excluded.sums_08, "
+                    "sums_10 = excluded.sums_10",
+                    (
+                        export_date,
+                        butikskod,
+                        pickle.dumps(header),
+                        pickle.dumps(sales.sums_08[butikskod]),
+                        pickle.dumps(sales.sums_10[butikskod]),
+                    ),
+                )
+            for butikskod, lines in new_lines_06.items():
+                self.connection.executemany(
+                    "INSERT INTO lines_06 VALUES (?, ?, ?)",
+                    ((export_date, butikskod, line) for line in lines),
+                )
+
+            for butikskod, sums_04 in payments.sums.items():
+                self.connection.execute(
+                    "INSERT INTO payment_stores VALUES (?, ?, ?) "
+                    "ON CONFLICT (export_date, butikskod) DO UPDATE SET "
+                    "sums_04 = excluded.sums_04",
+                    (export_date, butikskod, pickle.dumps(sums_04)),
+                )
+            self.connection.executemany(
+                "INSERT INTO payment_keys VALUES (?, ?)",
+                (
+                    (export_date, pickle.dumps(payment))
+                    for payment in payments.counted - payments.saved
+                ),
+            )
+        payments.saved = set(payments.counted)
+
+    def mark_full(self, export_date):
+        """Drops what is kept of export_date, which is exported as a whole from now on."""
+        with self.lock, self.connection:
+            for table in ["receipts", "sales_stores", "lines_06", "payment_stores", "payment_keys"]:
+                self.connection.execute(
+                    f"DELETE FROM {table} WHERE export_date = ?", (export_date,)
+                )
+            self.connection.execute(
+                "INSERT INTO days VALUES (?, 1) "
+                "ON CONFLICT (export_date) DO UPDATE SET full = 1",
+                (export_date,),
+            )
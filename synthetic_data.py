@@ -0,0 +1,343 @@
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Payment methods with the Bokföringssuffix they are booked on
+BETALMEDEL = {"KORT": 1580, "SWISH": 1930, "KONTANT": 1910, "PRESENTKORT": 2420}
+MOMS_SATSER = ["25 %", "12 %", "6 %"]
+
+
+def format_amount(öre, style="sv"):
+    """
+    An amount in öre the way WinBag writes it. "sv" is "1.234,50", "kronor"
+    drops the decimals, "1.490", and "plain" has no thousands separator, "1234,50".
+    """
+    sign = "-" if öre < 0 else ""
+    kronor, rest = divmod(abs(int(öre)), 100)
+    if style == "plain":
+        return f"{sign}{kronor},{rest:02d}"
+    grouped = f"{kronor:,}".replace(",", ".")
+    if style == "kronor":
+        return f"{sign}{grouped}"
+    return f"{sign}{grouped},{rest:02d}"
+
+
+def amount_pool(rng, size, low, high, styles=("sv",)):
+    """size formatted amounts between low and high öre, each in one of styles."""
+    öre = rng.integers(low, high, size)
+    chosen = rng.choice(list(styles), size)
+    return np.array(
+        [format_amount(value, style) for value, style in zip(öre.tolist(), chosen)],
+        dtype=object,
+    )
+
+
+def sales_dates(days, first_day):
+    return [(first_day + timedelta(days=day)).strftime("%d/%m/%Y") for day in range(days)]
+
+
+def write_csv(data, file_path, encoding, first, dropped=()):
+    data.drop(columns=list(dropped)).to_csv(
+        file_path,
+        sep=";",
+        index=False,
+        encoding=encoding,
+        mode="w" if first else "a",
+        header=first,
+    )
+
+
+def generate_export_files(
+    folder,
+    rows=1000,
+    stores=4,
+    days=1,
+    encoding="ISO-8859-1",
+    seed=0,
+    first_day=date(2025, 3, 10),
+    chunk_rows=500_000,
+    dok_datum=True,
+):
+    """
+    Writes the six input files of an export with rows Försäljning rows in
+    folder and returns their paths.
+
+    The sales are receipts of a few lines each, spread over stores and days,
+    with articles drawn from a catalogue so prices, momssatser and varugrupper
+    repeat the way they do in real files. Betalsätt has about one row per
+    receipt, Följesedlar a tenth of the rows and the Presentkort files fewer
+    still. Amounts come in the formats WinBag writes, "1.490" and "149,50"
+    among them. Large files are written chunk_rows rows at a time.
+
+    With dok_datum False only Försäljning and Följesedlar, which every export
+    reads it from, have a Dok.datum column, like the files the README lists.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+
+    butikskoder = np.array([f"{store + 1:02d}" for store in range(stores)], dtype=object)
+    serier = np.array([f"T{butikskod}1" for butikskod in butikskoder], dtype=object)
+    dates = np.array(sales_dates(days, first_day), dtype=object)
+    stamp = f"{first_day.isoformat()}_23-00-00"
+
+    # The article catalogue, each article with its own price, moms and varugrupp
+    articles = max(min(rows // 20, 20_000), 10)
+    referens = np.array([str(100000 + article) for article in range(articles)], dtype=object)
+    pris_öre = rng.integers(500, 150_000, articles)
+    pris = np.array([format_amount(öre, "plain") for öre in pris_öre.tolist()], dtype=object)
+    moms = rng.choice(np.array(MOMS_SATSER, dtype=object), articles, p=[0.7, 0.25, 0.05])
+    varugrupp = rng.choice([0, 10, 20, 30, 40, 50], articles)
+    # Netto for 1 to 3 of an article, and negated for returns
+    antal_choices = np.array([1, 2, 3])
+    netto_öre = (pris_öre[:, None] * antal_choices[None, :] * 4) // 5
+    netto = np.array(
+        [
+            [[format_amount(sign * öre, "sv") for öre in per_antal] for sign in (1, -1)]
+            for per_antal in netto_öre.tolist()
+        ],
+        dtype=object,
+    )
+    timmar = np.array(
+        [f"{hour:02d}:{minute:02d}:00" for hour in range(7, 23) for minute in range(60)],
+        dtype=object,
+    )
+
+    file_paths = {
+        "Försäljning": os.path.join(folder, f"Försäljning_{stamp}.csv"),
+        "Betalsätt": os.path.join(folder, f"Betalsätt_{stamp}.csv"),
+        "Följesedlar": os.path.join(folder, f"Följesedlar_{stamp}.csv"),
+        "Moms": os.path.join(folder, f"Moms_{stamp}.csv"),
+        "Presentkort_used": os.path.join(folder, f"Presentkort_used_{stamp}.csv"),
+        "Presentkort_sold": os.path.join(folder, f"Presentkort_sold_{stamp}.csv"),
+    }
+    belopp_pool = amount_pool(rng, 5000, 100, 500_000, ("sv", "sv", "kronor", "plain"))
+    betalmedel = np.array(list(BETALMEDEL), dtype=object)
+    suffix = np.array(list(BETALMEDEL.values()))
+    dropped = [] if dok_datum else ["Dok.datum"]
+
+    first_receipt = 1
+    for start in range(0, rows, chunk_rows):
+        size = min(chunk_rows, rows - start)
+        first = start == 0
+
+        # Receipts of 1 to 5 lines, in order, each in one store and on one day
+        receipts = max(size // 3, 1)
+        receipt = np.sort(rng.integers(0, receipts, size))
+        receipt_store = rng.integers(0, stores, receipts)
+        receipt_day = (np.arange(receipts) + start // 3) * days // max(rows // 3, 1)
+        receipt_day = np.minimum(receipt_day, days - 1)
+        receipt_return = rng.random(receipts) < 0.03
+        store = receipt_store[receipt]
+        article = rng.integers(0, articles, size)
+        antal = rng.choice(3, size, p=[0.8, 0.15, 0.05])
+        returned = receipt_return[receipt]
+
+        försäljning = pd.DataFrame(
+            {
+                "Serie": serier[store],
+                "Butikskod": butikskoder[store],
+                "ButikskodWinbag": butikskoder[store],
+                "KassaId": 1,
+                "Dok.datum": dates[receipt_day[receipt]],
+                "Nummer": receipt + first_receipt,
+                "Referens": referens[article],
+                "Enh.1": antal_choices[antal],
+                "Pris ": pris[article],
+                "Timme": timmar[rng.integers(0, len(timmar), receipts)][receipt],
+                "Anställd": rng.integers(1, 25, receipts)[receipt],
+                "Moms": moms[article],
+                "Kod för dokumenttyp": np.where(returned, 3, 1),
+                "Netto": netto[article, returned.astype(int), antal],
+                "Varugruppskod": varugrupp[article],
+            }
+        )
+        write_csv(försäljning, file_paths["Försäljning"], encoding, first)
+
+        # One payment per receipt, some receipts are paid with two methods
+        paid = np.concatenate([np.arange(receipts), np.flatnonzero(rng.random(receipts) < 0.1)])
+        paid.sort()
+        method = rng.choice(len(betalmedel), len(paid), p=[0.55, 0.3, 0.1, 0.05])
+        betalsätt = pd.DataFrame(
+            {
+                "Serie": serier[receipt_store[paid]],
+                "Nummer": paid + first_receipt,
+                "ButikskodWinbag": butikskoder[receipt_store[paid]],
+                "Kod för dokumenttyp": np.where(receipt_return[paid], 3, 1),
+                "Dok.Id": "TK",
+                "Betalmedel": betalmedel[method],
+                "Belopp": belopp_pool[rng.integers(0, len(belopp_pool), len(paid))],
+                "Bokföringssuffix": suffix[method],
+                "Dok.datum": dates[receipt_day[paid]],
+            }
+        )
+        write_csv(betalsätt, file_paths["Betalsätt"], encoding, first, dropped)
+
+        följesedlar_rows = max(size // 10, 1)
+        följesedel_store = rng.integers(0, stores, följesedlar_rows)
+        följesedel_article = rng.integers(0, articles, följesedlar_rows)
+        # Every note starts with a row without article, the one that carries the customer
+        nummer = np.sort(rng.integers(0, max(följesedlar_rows // 4, 1), följesedlar_rows))
+        first_of_note = np.r_[True, nummer[1:] != nummer[:-1]]
+        följesedlar = pd.DataFrame(
+            {
+                "Serie": "F1",
+                "ButikskodWinbag": butikskoder[följesedel_store],
+                "Nummer": nummer + start + 1,
+                "Bokföringssuffix": 1510,
+                "Dok.Id": "FS",
+                "Netto": belopp_pool[rng.integers(0, len(belopp_pool), följesedlar_rows)],
+                "Referens": np.where(first_of_note, "", referens[följesedel_article]),
+                "Benämning": "Kund Åkesson & Söner AB",
+                "Kundkod": rng.integers(1000, 1100, följesedlar_rows),
+                "Dok.datum": dates[rng.integers(0, days, följesedlar_rows)],
+                "Anställd": rng.integers(1, 25, följesedlar_rows),
+                "Ant.": rng.choice([1, 1, 2, -1], följesedlar_rows),
+                "Pris ": pris[följesedel_article],
+                "EnhetsprisExMoms": pris[följesedel_article],
+                "Moms": moms[följesedel_article],
+                "Rabatt": rng.choice([0, 0, 5, 10, 100], följesedlar_rows),
+            }
+        )
+        write_csv(följesedlar, file_paths["Följesedlar"], encoding, first)
+
+        presentkort_rows = max(size // 50, 1)
+        presentkort_store = rng.integers(0, stores, presentkort_rows)
+        presentkort = pd.DataFrame(
+            {
+                "Butikskod": butikskoder[presentkort_store],
+                "ButikskodWinbag": butikskoder[presentkort_store],
+                "Presentkortskonto": 2420,
+                "Kod för kundkortstransaktioner": rng.choice([2, 5], presentkort_rows),
+                "Belopp": belopp_pool[rng.integers(0, len(belopp_pool), presentkort_rows)],
+                "Dok.datum": dates[rng.integers(0, days, presentkort_rows)],
+            }
+        )
+        write_csv(presentkort, file_paths["Presentkort_used"], encoding, first, dropped)
+
+        sålda_rows = max(size // 100, 1)
+        # Cards sold without a Kundkortskod are left out of the 04 sums
+        kundkortskod = pd.Series(rng.integers(500_000, 600_000, sålda_rows), dtype="Int64")
+        kundkortskod[rng.random(sålda_rows) < 0.1] = pd.NA
+        presentkort_sålda = pd.DataFrame(
+            {
+                "Kundkortskod": kundkortskod,
+                "Kort": "Presentkort",
+                "Betalmedel": rng.choice(betalmedel[:3], sålda_rows),
+                "Belopp": belopp_pool[rng.integers(0, len(belopp_pool), sålda_rows)],
+                "Dok.datum": dates[rng.integers(0, days, sålda_rows)],
+            }
+        )
+        write_csv(presentkort_sålda, file_paths["Presentkort_sold"], encoding, first, dropped)
+
+        first_receipt += receipts
+
+    # One row per store, day and momssats
+    moms_rows = [
+        (butikskod, datum, sats)
+        for datum in dates
+        for butikskod in butikskoder
+        for sats in MOMS_SATSER
+    ]
+    bas = rng.integers(10_000, 5_000_000, len(moms_rows))
+    sats_procent = np.array([int(sats.split()[0]) for _, _, sats in moms_rows])
+    momsbelopp = bas * sats_procent // 100
+    moms_data = pd.DataFrame(
+        {
+            "Butikskod": [butikskod for butikskod, _, _ in moms_rows],
+            "ButikskodMomsWinbag": [butikskod for butikskod, _, _ in moms_rows],
+            "Moms": [sats for _, _, sats in moms_rows],
+            "Basbelopp": [format_amount(öre) for öre in bas.tolist()],
+            "Moms_2": [format_amount(öre) for öre in momsbelopp.tolist()],
+            "Totalbelopp": [format_amount(öre) for öre in (bas + momsbelopp).tolist()],
+            "Dok.datum": [datum for _, datum, _ in moms_rows],
+        }
+    )
+    write_csv(moms_data, file_paths["Moms"], encoding, True, dropped)
+
+    return list(file_paths.values())
+
+
+def pcs_line(values):
+    return ",".join(f'"{value}"' for value in values) + "\n"
+
+
+def generate_pcs_file(file_path, rows=1000, encoding="cp1252", seed=0):
+    """
+    Writes a PCS.ADM file with rows article records (02/22) and returns its path.
+
+    Around them are the 00 header, customers (01/11) for a twentieth of the
+    rows, huvudgrupper and varugrupper (03/33, the varugrupper with their
+    huvudgrupp in the 6th column) and the 99 trailer, in the layout
+    import_action splits.
+    """
+    rng = np.random.default_rng(seed)
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    huvudgrupper = 10
+    varugrupper = 50
+
+    with open(file_path, "w", encoding=encoding, newline="\r\n") as f:
+        f.write(pcs_line(["00", "PCS", "1.0", date.today().strftime("%Y%m%d")]))
+
+        for customer in range(max(rows // 20, 1)):
+            record_type = "01" if rng.random() < 0.8 else "11"
+            f.write(
+                pcs_line(
+                    [
+                        record_type,
+                        "",
+                        "",
+                        f"{customer + 1:04d}",
+                        f"Kund {customer + 1} Åkesson",
+                        f"Storgatan {customer % 90 + 1}",
+                        "Leveranskunder hotell,rest mm",
+                    ]
+                )
+            )
+
+        for huvudgrupp in range(huvudgrupper):
+            f.write(pcs_line(["03", "", "", "", huvudgrupp + 1, "", f"Huvudgrupp {huvudgrupp + 1}"]))
+        for varugrupp in range(varugrupper):
+            record_type = "03" if rng.random() < 0.8 else "33"
+            f.write(
+                pcs_line(
+                    [
+                        record_type,
+                        "",
+                        "",
+                        "",
+                        varugrupp % huvudgrupper + 1,
+                        varugrupp + 1,
+                        f"Varugrupp {varugrupp + 1} smörgåsar",
+                    ]
+                )
+            )
+
+        pris = rng.integers(500, 150_000, rows)
+        moms = rng.choice(["002500", "001200", "000600"], rows)
+        varugrupp = rng.integers(1, varugrupper + 1, rows)
+        for article in range(rows):
+            record_type = "02" if rng.random() < 0.9 else "22"
+            values = [
+                record_type,
+                "",
+                "",
+                article + 1,
+                f"Artikel {article + 1} Soppa & tårtbit TA",
+                f"73{article:011d}",
+                varugrupp[article] % huvudgrupper + 1,
+                varugrupp[article],
+                pris[article],
+                moms[article],
+                pris[article],
+            ]
+            f.write(pcs_line(values + [""] * (21 - len(values))))
+
+        f.write(pcs_line(["99", rows]))
+
+    return file_path